@@ -10,6 +10,7 @@ import static
 import staticgz
 import basicauth
 import fileio
+from headers import content_length
 from sitemap import Section, Page, NavMiddleware
 from tags import Template, tag, Placeholder
 
@@ -39,35 +40,49 @@ page = Template(
 )
 
 
+# Everything except the nav is the same on every request, so render it once
+# and just splice in each path's nav bytes
+_page = page.partial(
+    title='This is the title',
+    body=tag('p', {}, 'Hello, world')
+)
+(_prefix, _suffix), ((_, _nav_indent, _),) = _page.template
+PREFIX = _prefix.encode('utf8')
+SUFFIX = _suffix.encode('utf8')
+
+_CONTENT_TYPE = (b"Content-Type", b"text/html")
+_RESP_START = {
+    "type": "http.response.start",
+    "status": 200,
+    "headers": None,
+}
+
+
+def make_start(length):
+    # Middleware may extend the headers so each response needs its own list
+    start = _RESP_START.copy()
+    start["headers"] = [_CONTENT_TYPE, (b"Content-Length", content_length(length))]
+    return start
+
+
 async def app(scope, receive, send):
-    # assert scope["path"] == "/hello.html", scope["path"]
-    # assert scope["query_string"] == b"a=1&a=2&b=3", scope["query_string"]
-    msg = page.render(
-        title='This is the title',
-        nav=tag([
-            scope['nav'].main_nav(),
-            scope['nav'].breadcrumbs(),
-            scope['nav'].section_nav(),
-        ]),
-        body=tag('p', {}, 'Hello, world')
-    ).encode('utf8')
+    # assert scope["path"] == "/hello.html", scope["path"]
+    # assert scope["query_string"] == b"a=1&a=2&b=3", scope["query_string"]
+    nav = scope['nav'].render_bytes(_nav_indent)
     body = await receive()
+    if scope["method"] == "HEAD":
+        # Same headers as GET but there is no need to join up a body
+        await send(make_start(len(PREFIX) + len(nav) + len(SUFFIX)))
+        await send({"type": "http.response.body", "body": b""})
+        return
+    msg = PREFIX + nav + SUFFIX
     if scope["method"] == "POST":
         assert (
             body["body"] == b"hi"
         ), f'Expected body to be b"hi" but got, {body["body"]}'
         assert body["type"] == "http.request"
         assert body["more_body"] == False
-    await send(
-        {
-            "type": "http.response.start",
-            "status": 200,
-            "headers": [
-                (b"Content-Type", b"text/html"),
-                (b"Content-Length", str(len(msg)).encode("ascii")),
-            ],
-        }
-    )
+    await send(make_start(len(msg)))
     await send(
         {
             "type": "http.response.body",
@@ -96,6 +111,7 @@ application = staticgz.StaticGzipMiddleware(
         ),
         'www',
         'mimetypes.json',
+        enable_zerocopysend=True,
     ),
     'wwwgz',
     'wwwgz.json'
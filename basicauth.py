@@ -9,33 +9,50 @@
 import sys
 if sys.implementation.name == 'micropython':
     sys.path.append('micropython')
-from base64 import b64decode
+import hmac
+from binascii import a2b_base64
+from headers import content_length, header_map
+
+_UNAUTHORIZED = b'Unauthorized'
+# Middleware further out may add to the headers so each response gets a copy
+_RESP_401_HEADERS = (
+    (b'www-authenticate', b'Basic realm="Secure Area"'),
+    (b'content-type', b'text/plain'),
+    (b'content-length', content_length(len(_UNAUTHORIZED))),
+)
+_RESP_401_BODY = {
+    'type': 'http.response.body',
+    'body': _UNAUTHORIZED,
+}
 
 class BasicAuthMiddleware:
+
     def __init__(self, app, username: str, password: str):
         self.app = app
         self.username = username
         self.password = password
+        self.expected = username.encode('utf-8') + b':' + password.encode('utf-8')
 
     async def __call__(self, scope, receive, send):
         if scope['type'] == 'http':
-            headers = dict(scope['headers'])
-            auth_header = headers.get(b'authorization', None)
+            auth_header = header_map(scope).get(b'authorization')
 
             if auth_header is None:
                 await self.send_401(send)
                 return
 
-            auth_type, auth_value = auth_header.decode().split(" ", 1)
+            auth_type, _, auth_value = auth_header.partition(b' ')
 
-            if auth_type.lower() != 'basic':
+            if auth_type.lower() != b'basic':
                 await self.send_401(send)
                 return
 
-            decoded_auth = b64decode(auth_value).decode('utf-8')
-            username, password = decoded_auth.split(":", 1)
+            try:
+                decoded_auth = a2b_base64(auth_value)
+            except ValueError:
+                decoded_auth = b''
 
-            if username == self.username and password == self.password:
+            if hmac.compare_digest(decoded_auth, self.expected):
                 await self.app(scope, receive, send)
             else:
                 await self.send_401(send)
@@ -43,17 +60,9 @@ class BasicAuthMiddleware:
             raise Exception('Only http supported')
 
     async def send_401(self, send):
-        headers = [
-            (b'www-authenticate', b'Basic realm="Secure Area"'),
-            (b'content-type', b'text/plain'),
-            (b'content-length', b'12'),
-        ]
         await send({
             'type': 'http.response.start',
             'status': 401,
-            'headers': headers,
-        })
-        await send({
-            'type': 'http.response.body',
-            'body': b'Unauthorized',
+            'headers': list(_RESP_401_HEADERS),
         })
+        await send(_RESP_401_BODY)
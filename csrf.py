@@ -35,7 +35,7 @@ The CSRF token can be shared by multiple instances of this middleware wrapped ar
 
 In terms of technical implementation:
 
-We have pure ASGI middleware, no starlette, no methods except __init__ and __call__. We use the Python standard library for cookie handling.
+We have pure ASGI middleware, no starlette, no methods except __init__ and __call__. The cookie header is split by hand rather than with http.cookies since only the one cookie is needed.
 
 The CSRF Token Bundle is as follows:
 
@@ -67,7 +67,7 @@ The cookies should not work sub-domain (so we explicitly don't set the domain ot
 
 If multiple csrftoken variables are posted in the body, only the first is used, the rest are ignored.
 
-Rate limiting works by appending the current time of each signing attempt to a deque, then removing any entries from outside the last second and finally comparing the length of the deque with the max number of signing requests allowed per second set in __init__.
+Rate limiting works by keeping the times of the last max_tokens_per_interval signings in a ring buffer. If the oldest of them is still within interval_ms of the current signing attempt the limit has been reached. A monotonic clock is used so that changes to the system time don't affect it.
 
 
 This means we have CSRF nicely wrapped up in middleware, the ability to link the CSRF token to the session, the ability to renew CSRF tokens without changing the token.
@@ -85,51 +85,28 @@ if sys.implementation.name == 'micropython':
 import time
 import hashlib
 import hmac
-import base64
-from http.cookies import SimpleCookie
-from collections import deque
+
+from headers import content_length, header_map
 
 
 import sys
 if sys.implementation.name == 'micropython':
 
+    # time.monotonic
+    monotonic = time.time
+
     # os.urandom
     import random
     def urandom(n):
         """Generate `n` random bytes using random.getrandbits()"""
         return bytes(random.getrandbits(8) for _ in range(n))
 
+    from base64 import urlsafe_b64encode_without_padding
+    def new_csrf_token():
+        return urlsafe_b64encode_without_padding(urandom(32))
 
-    # urllib.parse_qs
-    def parse_qs(query):
-        """Parses a query string into a dictionary of lists."""
-        params = {}
-
-        # Split the query string by '&' to separate key-value pairs
-        pairs = query.split('&')
-
-        for pair in pairs:
-            if '=' in pair:
-                key, value = pair.split('=', 1)
-                key = unquote(key)
-                value = unquote(value)
-
-                # If the key is already in the dictionary, append the value to the list
-                if key in params:
-                    params[key].append(value)
-                else:
-                    # Otherwise, create a new list for this key
-                    params[key] = [value]
-            elif pair:
-                # Handle cases where there is a key without a value
-                key = unquote(pair)
-                if key in params:
-                    params[key].append('')
-                else:
-                    params[key] = ['']
-
-        return params
 
+    # urllib.parse.unquote
     def unquote(string):
         """Unquote a percent-encoded string (e.g., 'Hello%20World' -> 'Hello World')."""
         res = []
@@ -148,8 +125,31 @@ if sys.implementation.name == 'micropython':
 
 
 else:
+    from time import monotonic
     from os import urandom
-    from urllib.parse import parse_qs
+    from urllib.parse import unquote
+    from binascii import b2a_base64
+
+    _B64_TRANS = bytes.maketrans(b'+/', b'-_')
+    def new_csrf_token():
+        # 32 bytes always encode to 43 characters plus one '=' of padding
+        return b2a_base64(urandom(32), newline=False).translate(_B64_TRANS)[:-1].decode('ascii')
+
+
+_FORBIDDEN = b'403 Forbidden'
+# Middleware further out may add to the headers so each response gets a copy
+_RESP_403_HEADERS = (
+    (b'content-type', b'text/plain; charset=utf-8'),
+    (b'content-length', content_length(len(_FORBIDDEN))),
+)
+_RESP_403_BODY = {
+    'type': 'http.response.body',
+    'body': _FORBIDDEN,
+}
+
+
+def now_ms():
+    return time.time_ns() // 1_000_000
 
 
 class CSRFMiddleware:
@@ -157,87 +157,118 @@ class CSRFMiddleware:
         self.app = app
         self.get_session_from_scope = get_session_from_scope
         self.secret = secret
+        self.secret_bytes = secret.encode()
+        # Keyed once here, then copied for each signature to skip the key setup
+        self.hmac_proto = hmac.new(self.secret_bytes, digestmod=hashlib.sha256)
         self.token_ttl_ms = token_ttl * 1000
         self.renew_after_ms = renew_after * 1000
         self.secure = secure
         self.http_only = http_only
-        self.token_signing_times = deque()
+        # Only the bundle changes between responses so the attributes are built once
+        self.cookie_suffix = b'; Path=/; Max-Age=' + str(int(self.token_ttl_ms/1000.0)).encode('ascii')
+        if self.secure:
+            self.cookie_suffix += b'; Secure'
+        if self.http_only:
+            self.cookie_suffix += b'; HttpOnly'
+        self.cookie_suffix += b'; SameSite=Strict'
         self.max_tokens_per_interval = max_tokens_per_interval
+        self.token_signing_times = [None] * max_tokens_per_interval
+        self.token_signing_index = 0
         self.interval_ms = interval_ms
 
     def generate_csrf_token_bundle(self, session_id, re_use_csrf_token=None):
-        current_time = time.time()
-        self.enforce_rate_limit(current_time)
-        timestamp = str(int(current_time * 1000))
+        self.enforce_rate_limit(monotonic())
+        timestamp = str(now_ms())
         if re_use_csrf_token is None:
-            csrf_token = base64.urlsafe_b64encode(urandom(32)).decode('utf-8').rstrip('=')
+            csrf_token = new_csrf_token()
         else:
             csrf_token = re_use_csrf_token
-        signature = hmac.new(self.secret.encode(), f"{csrf_token}.{session_id}.{timestamp}".encode(), hashlib.sha256).hexdigest()
+        signature = self.sign(b'.'.join((csrf_token.encode(), session_id.encode(), timestamp.encode()))).hex()
         return f"{csrf_token}.{session_id}.{timestamp}.{signature}"
 
+    def sign(self, payload):
+        # The raw digest, the token carries it as lower case hex
+        h = self.hmac_proto.copy()
+        h.update(payload)
+        return h.digest()
+
     def enforce_rate_limit(self, current_time):
-        # Remove old timestamps outside the rate limit window (e.g., 1 second)
-        while self.token_signing_times and self.token_signing_times[0] < current_time - (self.interval_ms/1000.0):
-            self.token_signing_times.popleft()
+        # The signing times are a ring buffer, so the slot about to be overwritten
+        # holds the time of the signing max_tokens_per_interval signings ago
+        if len(self.token_signing_times) != self.max_tokens_per_interval:
+            self.token_signing_times = [None] * self.max_tokens_per_interval
+            self.token_signing_index = 0
+        oldest = self.token_signing_times[self.token_signing_index]
 
         # Enforce the rate limit globally
-        if len(self.token_signing_times) >= self.max_tokens_per_interval:
+        if oldest is not None and current_time - oldest < self.interval_ms/1000.0:
             raise Exception("Rate limit exceeded for CSRF token signing")
-        self.token_signing_times.append(current_time)
-        print(self.token_signing_times, self.max_tokens_per_interval, self.interval_ms)
+        self.token_signing_times[self.token_signing_index] = current_time
+        self.token_signing_index = (self.token_signing_index + 1) % self.max_tokens_per_interval
 
-    def validate_token(self, token):
+    def parse_token(self, token):
+        # Returns (csrf_token, session_id, timestamp_ms) for a valid, unexpired bundle, otherwise None
         try:
-            random_data, session_id, timestamp, signature = token.split('.')
-            expected_signature = hmac.new(self.secret.encode(), f"{random_data}.{session_id}.{timestamp}".encode(), hashlib.sha256).hexdigest()
-            if not hmac.compare_digest(signature, expected_signature):
-                return False
-            if int(time.time() * 1000) > int(timestamp) + self.token_ttl_ms:
-                return False
-            return True
+            parts = token.split('.', 3)
+            random_data, session_id, timestamp, signature = parts
+            expected_signature = self.sign(b'.'.join([part.encode() for part in parts[:3]]))
+            # Compare the exact hex that was issued, fromhex() would also accept
+            # upper case and spaces so several strings would pass as one token
+            if not hmac.compare_digest(signature.encode(), expected_signature.hex().encode()):
+                return None
+            timestamp_ms = int(timestamp)
+            if now_ms() > timestamp_ms + self.token_ttl_ms:
+                return None
+            return random_data, session_id, timestamp_ms
         except ValueError:
-            return False
+            return None
+
+    def validate_token(self, token):
+        return self.parse_token(token) is not None
 
     async def __call__(self, scope, receive, send):
         if scope['type'] != 'http':
             raise Exception('Only for HTTP')
 
-        body = await self.receive_body(receive)
+        headers = header_map(scope)
+        content_type = headers.get(b'content-type', b'').lower()
+        cookie_header = headers.get(b'cookie', b'')
+        may_have_body = headers.get(b'content-length', b'0').strip() != b'0' or b'transfer-encoding' in headers
+
+        safe_method = scope['method'] in ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+        if safe_method and not may_have_body:
+            # Nothing to read, and the app is still only ever given the (empty) body checked here
+            body = b''
+        else:
+            body = await self.receive_body(receive)
         required = False
-        if bool(body) or scope['method'] not in ('GET', 'HEAD', 'OPTIONS', 'TRACE'):
+        if bool(body) or not safe_method:
             required = True
 
-        content_type = dict(scope.get('headers', [])).get(b'content-type', b'').lower()
         if required and content_type != b'application/x-www-form-urlencoded':
             await self.forbidden_response(send)
             return
 
-        form_data = parse_qs(body.decode('utf-8')) if body else {}
-        form_csrf_token = form_data.get('csrftoken', [None])[0]
+        form_csrf_token = self.parse_form_token(body)
 
-        cookies = self.parse_cookies(scope.get('headers', []))
+        cookies = self.parse_cookies(cookie_header)
         csrf_token_bundle = cookies.get('csrf_token_bundle')
 
         session_id = self.get_session_from_scope(scope)
 
         next_csrf_token_bundle = None
-        token_validity = False
         cookie_csrf_token = None
         cookie_session_id = None
 
-        if csrf_token_bundle:
-            token_validity = self.validate_token(csrf_token_bundle)
-            if token_validity:
-                cookie_csrf_token, cookie_session_id, cookie_timestamp, cookie_signature = csrf_token_bundle.split('.')
-                now = time.time()
-                print('>', 'now:', now, 'int(now * 1000):', int(now * 1000), 'cookie_timestamp:', cookie_timestamp, 'renew_after_ms:', self.renew_after_ms)
-                if (int(now * 1000) > int(cookie_timestamp) + self.renew_after_ms and (cookie_session_id == '' or cookie_session_id == session_id)) or (cookie_session_id == '' and session_id != cookie_session_id):
-                    next_csrf_token_bundle = self.generate_csrf_token_bundle(session_id, re_use_csrf_token=cookie_csrf_token)
+        token = csrf_token_bundle and self.parse_token(csrf_token_bundle)
+        if token:
+            cookie_csrf_token, cookie_session_id, cookie_timestamp_ms = token
+            if (now_ms() > cookie_timestamp_ms + self.renew_after_ms and (cookie_session_id == '' or cookie_session_id == session_id)) or (cookie_session_id == '' and session_id != cookie_session_id):
+                next_csrf_token_bundle = self.generate_csrf_token_bundle(session_id, re_use_csrf_token=cookie_csrf_token)
         else:
+            # No bundle, or one that is invalid or expired, so start again with a new CSRF token
             next_csrf_token_bundle = self.generate_csrf_token_bundle(session_id)
 
-        print('csrf_token_bundle:', csrf_token_bundle, ', token_validity:', token_validity, ', next_csrf_token_bundle:', next_csrf_token_bundle, 'required:', required, 'cookie_csrf_token:', cookie_csrf_token, 'form_csrf_token:', form_csrf_token, 'cookie_session_id:', cookie_session_id, 'session_id:', session_id, 'body:', body, 'form_data:', form_data)
         if required and (not cookie_csrf_token or not form_csrf_token or cookie_csrf_token != form_csrf_token or (cookie_session_id != '' and cookie_session_id != session_id)):
             await self.forbidden_response(send)
             return
@@ -251,40 +282,49 @@ class CSRFMiddleware:
 
         async def send_wrapper(message):
             if message['type'] == 'http.response.start' and next_csrf_token_bundle:
-                headers = message.setdefault('headers', [])
-                cookie = SimpleCookie()
-                cookie['csrf_token_bundle'] = next_csrf_token_bundle
-                cookie['csrf_token_bundle']['path'] = '/'
-                if self.http_only:
-                    cookie['csrf_token_bundle']['httponly'] = True
-                if self.secure:
-                    cookie['csrf_token_bundle']['secure'] = True
-                cookie['csrf_token_bundle']['samesite'] = 'Strict'
-                cookie['csrf_token_bundle']['max-age'] = int(self.token_ttl_ms/1000.0)
-                new_cookie_header = cookie.output(header='', sep='').encode('utf-8').strip()
-                for i, (name, value) in enumerate(headers):
-                    if name.lower() == b'set-cookie':
-                        headers[i] = (name, value + b', ' + new_cookie_header)
-                        break
-                else:
-                    headers.append((b'set-cookie', new_cookie_header))
+                # Each cookie needs its own Set-Cookie header, they can't be combined with commas
+                message.setdefault('headers', []).append((
+                    b'set-cookie',
+                    b'csrf_token_bundle=' + next_csrf_token_bundle.encode('utf-8') + self.cookie_suffix,
+                ))
             await send(message)
 
         await self.app(scope, receive, send_wrapper)
 
-    def parse_cookies(self, headers):
-        cookie_header = next((value for key, value in headers if key == b'cookie'), b'')
-        cookies = SimpleCookie(cookie_header.decode('latin1'))
-        return {key: morsel.value for key, morsel in cookies.items()}
+    def parse_cookies(self, cookie_header):
+        # Only the bundle is needed so there's no point parsing every cookie
+        for part in cookie_header.decode('latin1').split(';'):
+            name, sep, value = part.strip().partition('=')
+            if name == 'csrf_token_bundle':
+                return {'csrf_token_bundle': value}
+        return {}
+
+    def parse_form_token(self, body):
+        # Only csrftoken is needed so scan for it rather than parsing the whole form
+        needle = b'csrftoken='
+        i = body.find(needle)
+        while i != -1:
+            if i == 0 or body[i - 1] == 38:  # b'&'
+                start = i + len(needle)
+                end = body.find(b'&', start)
+                if end == -1:
+                    end = len(body)
+                return unquote(body[start:end].decode('utf-8'))
+            i = body.find(needle, i + 1)
+        return None
 
     async def receive_body(self, receive):
-        body = b''
+        chunks = []
         more_body = True
         while more_body:
             message = await receive()
-            body += message.get('body', b'')
+            chunk = message.get('body')
+            if chunk:
+                chunks.append(chunk)
             more_body = message.get('more_body', False)
-        return body
+        if len(chunks) == 1:
+            return chunks[0]
+        return b''.join(chunks)
 
     def wrap_receive(self, receive, body):
         async def receive_wrapper():
@@ -296,16 +336,9 @@ class CSRFMiddleware:
         return receive_wrapper
 
     async def forbidden_response(self, send):
-        response_headers = [
-            (b'content-type', b'text/plain; charset=utf-8'),
-        ]
-        response_body = b'403 Forbidden'
         await send({
             'type': 'http.response.start',
             'status': 403,
-            'headers': response_headers,
-        })
-        await send({
-            'type': 'http.response.body',
-            'body': response_body,
+            'headers': list(_RESP_403_HEADERS),
         })
+        await send(_RESP_403_BODY)
@@ -32,29 +32,28 @@ These tests cover the core behaviors expected of the CSRF middleware as describe
 import unittest
 from urllib.parse import urlencode
 from csrf import CSRFMiddleware
-from unittest.mock import AsyncMock
-import http.cookies
-import time
 
 import hmac
-import hashlib
 from unittest.mock import patch
 
 
+FORM_PAGE_PREFIX, FORM_PAGE_SUFFIX = b"""
+<html>
+<body>
+<form method="post">
+<input type="hidden" name="csrftoken" value="%s">
+</form>
+</body>
+</html>
+""".split(b"%s")
+
+
 class TestApp:
     """A simple test app to simulate downstream ASGI behavior."""
     async def __call__(self, scope, receive, send):
         if scope["type"] == "http":
             if scope["method"] == "GET" and scope["path"] == "/":
-                response_body = b"""
-                <html>
-                <body>
-                <form method="post">
-                <input type="hidden" name="csrftoken" value="%s">
-                </form>
-                </body>
-                </html>
-                """ % scope["csrf"].encode()
+                response_body = FORM_PAGE_PREFIX + scope["csrf"].encode() + FORM_PAGE_SUFFIX
 
                 await send({
                     "type": "http.response.start",
@@ -88,24 +87,61 @@ class TestApp:
                 })
 
 
+BASE_HEADERS = (
+    (b"host", b"localhost"),
+)
+FORM_CONTENT_TYPE = (b"content-type", b"application/x-www-form-urlencoded")
+EMPTY_REQUEST = {
+    "type": "http.request",
+    "body": b"",
+    "more_body": False
+}
+
+
+async def empty_receive():
+    return EMPTY_REQUEST
+
+
+CSRF_MARK = b'name="csrftoken" value="'
+CSRF_MARK_LEN = len(CSRF_MARK)
+
+
+def parse_set_cookie(value):
+    # Only the name and value are needed, not the attributes after the first ';'
+    name, _, cookie_value = value.decode('ascii').split(';', 1)[0].partition('=')
+    return name.strip(), cookie_value
+
+
 class CSRFMiddlewareTest(unittest.IsolatedAsyncioTestCase):
 
-    def setUp(self):
+    @classmethod
+    def setUpClass(cls):
         secret = "supersecret"
-        self.app = CSRFMiddleware(TestApp(), secret=secret, secure=False, get_session_from_scope=lambda x: '')
+        cls.app = CSRFMiddleware(TestApp(), secret=secret, secure=False, get_session_from_scope=lambda x: '')
+        cls.secret_bytes = secret.encode()
+        cls.app_defaults = dict(vars(cls.app))
+
+    def setUp(self):
+        # Tests change settings on the shared middleware so put them back, and start with no tokens signed
+        vars(self.app).update(self.app_defaults)
+        self.app.token_signing_times = [None] * self.app.max_tokens_per_interval
+        # Move a fake clock forward instead of sleeping until tokens renew or rate limits reset
+        self.clock_ms = 1_700_000_000_000
+        for name, fake in [('now_ms', lambda: self.clock_ms), ('monotonic', lambda: self.clock_ms / 1000)]:
+            patcher = patch('csrf.' + name, fake)
+            patcher.start()
+            self.addCleanup(patcher.stop)
 
     async def simulate_request(self, path, method="GET", body=None, cookies=None):
         # Prepare headers
-        headers = [
-            (b"host", b"localhost"),
-        ]
+        headers = list(BASE_HEADERS)
 
         if body:
-            headers.append((b"content-type", b"application/x-www-form-urlencoded"))
+            headers.append(FORM_CONTENT_TYPE)
 
         if cookies:
             cookie_header = "; ".join([f"{k}={v}" for k, v in cookies.items()])
-            headers.append((b"cookie", cookie_header.encode('utf-8')))
+            headers.append((b"cookie", cookie_header.encode('ascii')))
 
         # Create an ASGI scope
         scope = {
@@ -118,57 +154,59 @@ class CSRFMiddlewareTest(unittest.IsolatedAsyncioTestCase):
         # Prepare the body and receive function
         if body:
             body_bytes = urlencode(body).encode('utf-8')
-            receive = AsyncMock(return_value={
+            headers.append((b"content-length", str(len(body_bytes)).encode('ascii')))
+            request_message = {
                 "type": "http.request",
                 "body": body_bytes,
                 "more_body": False
-            })
+            }
+            async def receive():
+                return request_message
         else:
-            receive = AsyncMock(return_value={
-                "type": "http.request",
-                "body": b"",
-                "more_body": False
-            })
+            receive = empty_receive
 
-        # Prepare the mock send function to capture the response
-        send = AsyncMock()
+        # Prepare the send function to capture the response
+        sent = []
+        async def send(message):
+            sent.append(message)
 
         # Call the middleware with the prepared scope, receive, and send
         await self.app(scope, receive, send)
 
         # Capture the response start and body
-        response_start = send.mock_calls[0][1][0] if send.mock_calls else None
-        response_body = send.mock_calls[1][1][0]['body'] if len(send.mock_calls) > 1 else b""
+        response_start = sent[0] if sent else None
+        response_body = sent[1]['body'] if len(sent) > 1 else b""
+
+        return response_start, response_body, sent
 
-        return response_start, response_body, send
+    def extract_cookies(self, headers):
+        return dict(parse_set_cookie(value) for header, value in headers if header == b'set-cookie')
+
+    async def post_process(self, form_data, cookies):
+        response_start, response_body, _ = await self.simulate_request("/process", method="POST", body=form_data, cookies=cookies)
+        return response_start['status'], response_body
 
     async def get_csrf_cookie_and_token(self):
         # Perform a GET request to retrieve the CSRF cookie and token
-        response_start, response_body, send = await self.simulate_request("/")
+        response_start, response_body, sent = await self.simulate_request("/")
 
         # Extract the Set-Cookie header from the response
-        cookies = {}
-        for header, value in response_start['headers']:
-            if header == b'set-cookie':
-                cookie_value = value.decode('utf-8')
-                cookie = http.cookies.SimpleCookie(cookie_value)
-                for key in cookie:
-                    cookies[key] = cookie[key].value
+        cookies = self.extract_cookies(response_start['headers'])
 
         # Extract the CSRF token from the form in the response body
-        csrf_token_start = response_body.find(b'name="csrftoken" value="') + len(b'name="csrftoken" value="')
-        csrf_token_end = response_body.find(b'"', csrf_token_start)
-        csrf_token = response_body[csrf_token_start:csrf_token_end].decode('utf-8')
+        csrf_token_start = response_body.find(CSRF_MARK) + CSRF_MARK_LEN
+        csrf_token_end = response_body.find(b'"', csrf_token_start, csrf_token_start + 128)
+        csrf_token = response_body[csrf_token_start:csrf_token_end].decode('ascii')
 
         return cookies, csrf_token
 
     async def test_csrf_token_generation_on_get(self):
-        response_start, response_body, send = await self.simulate_request("/")
+        response_start, response_body, sent = await self.simulate_request("/")
         self.assertEqual(response_start["status"], 200)
         self.assertIn(b'csrftoken', response_body)
 
     async def test_csrf_token_in_cookie_on_get(self):
-        response_start, response_body, send = await self.simulate_request("/")
+        response_start, response_body, sent = await self.simulate_request("/")
         cookie_headers = [header for header, value in response_start["headers"] if header == b'set-cookie']
         self.assertTrue(cookie_headers, "CSRF token should be set in the cookie on GET requests.")
 
@@ -180,10 +218,9 @@ class CSRFMiddlewareTest(unittest.IsolatedAsyncioTestCase):
         form_data = {
             "csrftoken": csrf_token,
         }
-        print(form_data, cookies)
-        response_start, response_body, _ = await self.simulate_request("/process", method="POST", body=form_data, cookies=cookies)
+        status, response_body = await self.post_process(form_data, cookies)
 
-        self.assertEqual(response_start['status'], 200, "CSRF validation should pass with a valid token")
+        self.assertEqual(status, 200, "CSRF validation should pass with a valid token")
         self.assertIn(b"CSRF test passed", response_body)
 
     async def test_form_submission_csrf_failure(self):
@@ -195,8 +232,8 @@ class CSRFMiddlewareTest(unittest.IsolatedAsyncioTestCase):
             "csrftoken": "invalid-token",
         }
 
-        response_start, response_body, _ = await self.simulate_request("/process", method="POST", body=form_data, cookies=cookies)
-        self.assertEqual(response_start['status'], 403, "CSRF failure should return a 403 status")
+        status, response_body = await self.post_process(form_data, cookies)
+        self.assertEqual(status, 403, "CSRF failure should return a 403 status")
 
     async def test_no_csrf_cookie(self):
         # Simulate a POST request without a CSRF cookie
@@ -204,16 +241,16 @@ class CSRFMiddlewareTest(unittest.IsolatedAsyncioTestCase):
             "csrftoken": "random-token",
         }
 
-        response_start, response_body, _ = await self.simulate_request("/process", method="POST", body=form_data, cookies={})
-        self.assertEqual(response_start['status'], 403, "CSRF check should fail if there is no CSRF cookie.")
+        status, response_body = await self.post_process(form_data, {})
+        self.assertEqual(status, 403, "CSRF check should fail if there is no CSRF cookie.")
 
     async def test_no_csrf_token_in_form(self):
         # Get the CSRF cookie and token from the form
         cookies, _ = await self.get_csrf_cookie_and_token()
 
         # Simulate a POST request without a CSRF token in the form
-        response_start, response_body, _ = await self.simulate_request("/process", method="POST", body={}, cookies=cookies)
-        self.assertEqual(response_start['status'], 403, "CSRF check should fail if there is no CSRF token in the form.")
+        status, response_body = await self.post_process({}, cookies)
+        self.assertEqual(status, 403, "CSRF check should fail if there is no CSRF token in the form.")
 
 
     async def test_expired_csrf_token(self):
@@ -221,16 +258,13 @@ class CSRFMiddlewareTest(unittest.IsolatedAsyncioTestCase):
         cookies, csrf_token = await self.get_csrf_cookie_and_token()
 
         # Extract the session_id, timestamp, and signature
-        token_parts = cookies['csrf_token_bundle'].split('.')
-        csrf_token = token_parts[0]
-        session_id = token_parts[1]
-        timestamp = int(token_parts[2])
-        signature = token_parts[3]
+        csrf_token, session_id, timestamp, signature = cookies['csrf_token_bundle'].split('.', 3)
+        timestamp = int(timestamp)
 
         # Create an expired timestamp by subtracting the expiration time from the current timestamp
         expired_timestamp = str(timestamp - (self.app.token_ttl_ms + 1))
 
-        expired_signature = hmac.new(self.app.secret.encode(), f"{csrf_token}.{session_id}.{expired_timestamp}".encode(), hashlib.sha256).hexdigest()
+        expired_signature = hmac.digest(self.secret_bytes, b'.'.join((csrf_token.encode(), session_id.encode(), expired_timestamp.encode())), 'sha256').hex()
 
         # Manually craft an expired CSRF token
         cookies = {'csrf_token_bundle': f"{csrf_token}.{session_id}.{expired_timestamp}.{expired_signature}"}
@@ -240,142 +274,139 @@ class CSRFMiddlewareTest(unittest.IsolatedAsyncioTestCase):
             "csrftoken": csrf_token,
         }
 
-        response_start, response_body, _ = await self.simulate_request("/process", method="POST", body=form_data, cookies=cookies)
+        status, response_body = await self.post_process(form_data, cookies)
 
         # Assert that the request is forbidden due to the expired token
-        self.assertEqual(response_start['status'], 403, "CSRF validation should fail with an expired token")
-
-    async def test_successful_csrf_token_renewal(self):
-        # Set a short renew_after_ms period for testing purposes
-        self.app.renew_after_ms = 1  # Renew after 1 millisecond
-
-        for path, method, send_body in [
-            ("/", "GET", False),
-            ("/process", "POST", True),
-            ("/process", "GET", True),
-        ]:
-            # Simulate a GET request to get the initial CSRF cookie and token
-            cookies, csrf_token = await self.get_csrf_cookie_and_token()
+        self.assertEqual(status, 403, "CSRF validation should fail with an expired token")
 
-            # Extract the original session_id, timestamp, and signature from the CSRF token bundle
-            original_csrf_token, original_session_id, original_timestamp, original_signature = cookies['csrf_token_bundle'].split('.')
+    async def test_signature_must_be_exact_hex(self):
+        cookies, csrf_token = await self.get_csrf_cookie_and_token()
+        bundle = cookies['csrf_token_bundle']
+        prefix, signature = bundle.rsplit('.', 1)
+        self.assertIsNotNone(self.app.parse_token(bundle))
+
+        # bytes.fromhex() reads all of these as the same signature, but only the issued form is valid
+        for altered in (signature.upper(), signature[:2] + ' ' + signature[2:], ' ' + signature):
+            cookies = {'csrf_token_bundle': f"{prefix}.{altered}"}
+            status, response_body = await self.post_process({"csrftoken": csrf_token}, cookies)
+            self.assertEqual(status, 403, "Only the exact issued signature should validate")
+
+    async def assert_renewed(self, path, method, send_body, cookies, csrf_token):
+        # Extract the original session_id, timestamp, and signature from the CSRF token bundle
+        original_csrf_token, original_session_id, original_timestamp, original_signature = cookies['csrf_token_bundle'].split('.', 3)
+
+        # Prepare the request data
+        form_data = None
+        if send_body:
+            form_data = {
+                "csrftoken": csrf_token,
+            }
+
+        # Simulate the request after the renewal period
+        response_start, response_body, _ = await self.simulate_request(
+            path,
+            method=method,
+            body=form_data,
+            cookies=cookies
+        )
 
-            # Wait for the renewal period to pass
-            time.sleep((self.app.renew_after_ms+1)/1000.0)
+        # Ensure the request succeeded and a new CSRF token bundle is issued
+        self.assertEqual(response_start['status'], 200, "CSRF validation should pass and renew the token")
 
-            # Prepare the request data
-            form_data = None
-            if send_body:
-                form_data = {
-                    "csrftoken": csrf_token,
-                }
+        # Parse the new cookies
+        new_cookies = self.extract_cookies(response_start["headers"])
 
-            # Simulate the request after the renewal period
-            response_start, response_body, _ = await self.simulate_request(
-                path,
-                method=method,
-                body=form_data,
-                cookies=cookies
-            )
+        # Extract the new CSRF token and session_id from the reissued cookie
+        new_csrf_token_bundle = new_cookies['csrf_token_bundle']
+        new_csrf_token, new_session_id, new_timestamp, new_signature = new_csrf_token_bundle.split('.', 3)
 
-            # Ensure the request succeeded and a new CSRF token bundle is issued
-            self.assertEqual(response_start['status'], 200, "CSRF validation should pass and renew the token")
+        # Ensure the session ID remains unchanged
+        self.assertEqual(original_session_id, new_session_id, "The session ID should remain unchanged after renewal")
 
-            # Extract the Set-Cookie header from the response
-            new_cookie_headers = [header for header, value in response_start["headers"] if header == b'set-cookie']
+        # Ensure the CSRF token itself remains unchanged
+        self.assertEqual(original_csrf_token, new_csrf_token, "The CSRF token should remain the same after renewal")
 
-            # Parse the new cookies
-            new_cookies = {}
-            for header, value in response_start["headers"]:
-                if header == b'set-cookie':
-                    cookie_value = value.decode('utf-8')
-                    cookie = http.cookies.SimpleCookie(cookie_value)
-                    for key in cookie:
-                        new_cookies[key] = cookie[key].value
+        # Ensure the timestamp is updated to a newer value
+        self.assertGreater(new_timestamp, original_timestamp, "The timestamp should be updated in the new CSRF token bundle")
 
-            # Extract the new CSRF token and session_id from the reissued cookie
-            print('===', new_cookies)
-            new_csrf_token_bundle = new_cookies['csrf_token_bundle']
-            new_csrf_token, new_session_id, new_timestamp, new_signature = new_csrf_token_bundle.split('.')
+        # Ensure that the signature is correctly regenerated for the renewed token
+        expected_signature = hmac.digest(self.secret_bytes, b'.'.join((new_csrf_token.encode(), new_session_id.encode(), new_timestamp.encode())), 'sha256').hex()
+        self.assertTrue(hmac.compare_digest(new_signature, expected_signature), "The signature should match the expected signature for the renewed CSRF token bundle")
 
-            # Ensure the session ID remains unchanged
-            self.assertEqual(original_session_id, new_session_id, "The session ID should remain unchanged after renewal")
+    async def test_successful_csrf_token_renewal(self):
+        # Set a short renew_after_ms period for testing purposes
+        self.app.renew_after_ms = 1  # Renew after 1 millisecond
 
-            # Ensure the CSRF token itself remains unchanged
-            self.assertEqual(original_csrf_token, new_csrf_token, "The CSRF token should remain the same after renewal")
+        # Simulate a GET request to get the initial CSRF cookie and token
+        cookies, csrf_token = await self.get_csrf_cookie_and_token()
 
-            # Ensure the timestamp is updated to a newer value
-            self.assertGreater(new_timestamp, original_timestamp, "The timestamp should be updated in the new CSRF token bundle")
+        # Wait for the renewal period to pass
+        self.clock_ms += self.app.renew_after_ms + 1
 
-            # Ensure that the signature is correctly regenerated for the renewed token
-            expected_signature = hmac.new(self.app.secret.encode(), f"{new_csrf_token}.{new_session_id}.{new_timestamp}".encode(), hashlib.sha256).hexdigest()
-            self.assertEqual(new_signature, expected_signature, "The signature should match the expected signature for the renewed CSRF token bundle")
+        for path, method, send_body in [
+            ("/", "GET", False),
+            ("/process", "POST", True),
+            ("/process", "GET", True),
+        ]:
+            with self.subTest(path=path, method=method):
+                await self.assert_renewed(path, method, send_body, cookies, csrf_token)
 
         # Put the default back
         self.app.renew_after_ms = 600_000
 
 
     async def test_token_reissue_on_session_creation(self):
+        self.app.get_session_from_scope = lambda x: ''
+        # Simulate a GET request to get the initial CSRF cookie and token
+        cookies, csrf_token = await self.get_csrf_cookie_and_token()
+
+        # Extract the original session_id, timestamp, and signature
+        original_csrf_token, original_session_id, original_timestamp, original_signature = cookies['csrf_token_bundle'].split('.', 3)
+        self.assertEqual(original_session_id, '', "The original session ID should be ''")
+
         for path, method, send_body in [
             ("/", "GET", False),
             ("/process", "POST", True),
             ("/process", "GET", True),
         ]:
-            self.app.get_session_from_scope = lambda x: ''
-            # Simulate a GET request to get the initial CSRF cookie and token
-            cookies, csrf_token = await self.get_csrf_cookie_and_token()
-
-            # Extract the original session_id, timestamp, and signature
-            original_csrf_token, original_session_id, original_timestamp, original_signature = cookies['csrf_token_bundle'].split('.')
-            self.assertEqual(original_session_id, '', "The original session ID should be ''")
+            with self.subTest(path=path, method=method):
+                # Simulate a new session creation by modifying the session ID
+                self.app.get_session_from_scope = lambda x: 'new-session-id'
 
-            # Simulate a new session creation by modifying the session ID
-            self.app.get_session_from_scope = lambda x: 'new-session-id'
+                form_data = None
+                if send_body:
+                    form_data = {
+                        "csrftoken": csrf_token,
+                    }
 
-            form_data = None
-            if send_body:
-                form_data = {
-                    "csrftoken": csrf_token,
-                }
+                response_start, response_body, _ = await self.simulate_request(
+                    path,
+                    method=method,
+                    body=form_data,
+                    cookies=cookies
+                )
 
-            response_start, response_body, _ = await self.simulate_request(
-                path,
-                method=method,
-                body=form_data,
-                cookies=cookies
-            )
+                # Ensure the request succeeded since the CSRF token hasn't changed
+                self.assertEqual(response_start['status'], 200, "CSRF validation should pass with the original token after session creation")
 
-            # Ensure the request succeeded since the CSRF token hasn't changed
-            self.assertEqual(response_start['status'], 200, "CSRF validation should pass with the original token after session creation")
+                # Parse the new cookies
+                new_cookies = self.extract_cookies(response_start["headers"])
 
-            # Extract the Set-Cookie header from the response
-            new_cookie_headers = [header for header, value in response_start["headers"] if header == b'set-cookie']
+                # Extract the new CSRF token and session_id from the reissued cookie
+                new_csrf_token_bundle = new_cookies['csrf_token_bundle']
+                new_csrf_token, new_session_id, new_timestamp, new_signature = new_csrf_token_bundle.split('.', 3)
+                self.assertEqual(new_session_id, 'new-session-id', "The session ID in the new CSRF token bundle should match the new session ID")
 
-            # Parse the new cookies
-            new_cookies = {}
-            for header, value in response_start["headers"]:
-                if header == b'set-cookie':
-                    cookie_value = value.decode('utf-8')
-                    cookie = http.cookies.SimpleCookie(cookie_value)
-                    for key in cookie:
-                        new_cookies[key] = cookie[key].value
+                # Ensure the CSRF token (without session ID) is unchanged
+                self.assertEqual(original_csrf_token, new_csrf_token, "The CSRF token should remain the same after session creation")
 
-            print(response_start["headers"])
-            # Extract the new CSRF token and session_id from the reissued cookie
-            new_csrf_token_bundle = new_cookies['csrf_token_bundle']
-            new_csrf_token, new_session_id, new_timestamp, new_signature = new_csrf_token_bundle.split('.')
-            self.assertEqual(new_session_id, 'new-session-id', "The session ID in the new CSRF token bundle should match the new session ID")
+                # Ensure the session ID is updated
+                self.assertNotEqual(original_session_id, new_session_id, "The session ID should be updated in the new CSRF token bundle")
 
-            # Ensure the CSRF token (without session ID) is unchanged
-            self.assertEqual(original_csrf_token, new_csrf_token, "The CSRF token should remain the same after session creation")
-
-            # Ensure the session ID is updated
-            self.assertNotEqual(original_session_id, new_session_id, "The session ID should be updated in the new CSRF token bundle")
-
-            self.assertGreaterEqual(new_timestamp, original_timestamp, "The timestamp for the new CSRF token bundle should be greater than or equal to the original")
-            # Ensure that the signature is correctly regenerated for the new session ID
-            expected_signature = hmac.new(self.app.secret.encode(), f"{new_csrf_token}.{new_session_id}.{new_timestamp}".encode(), hashlib.sha256).hexdigest()
-            self.assertEqual(new_signature, expected_signature, "The signature should match the expected signature for the new session ID")
+                self.assertGreaterEqual(new_timestamp, original_timestamp, "The timestamp for the new CSRF token bundle should be greater than or equal to the original")
+                # Ensure that the signature is correctly regenerated for the new session ID
+                expected_signature = hmac.digest(self.secret_bytes, b'.'.join((new_csrf_token.encode(), new_session_id.encode(), new_timestamp.encode())), 'sha256').hex()
+                self.assertTrue(hmac.compare_digest(new_signature, expected_signature), "The signature should match the expected signature for the new session ID")
 
         # Put the default back
         self.app.get_session_from_scope = lambda x: ''
@@ -387,8 +418,11 @@ class CSRFMiddlewareTest(unittest.IsolatedAsyncioTestCase):
             "path": "/",
             "headers": [],
         }
-        receive = AsyncMock(return_value={"type": "websocket.connect"})
-        send = AsyncMock()
+        async def receive():
+            return {"type": "websocket.connect"}
+        sent = []
+        async def send(message):
+            sent.append(message)
 
         with self.assertRaises(Exception) as context:
             await self.app(scope, receive, send)
@@ -423,20 +457,24 @@ class CSRFMiddlewareTest(unittest.IsolatedAsyncioTestCase):
 
         # Prepare the body and receive function
         body_bytes = urlencode(form_data).encode('utf-8')
-        receive = AsyncMock(return_value={
+        request_message = {
             "type": "http.request",
             "body": body_bytes,
             "more_body": False
-        })
+        }
+        async def receive():
+            return request_message
 
-        # Prepare the mock send function to capture the response
-        send = AsyncMock()
+        # Prepare the send function to capture the response
+        sent = []
+        async def send(message):
+            sent.append(message)
 
         # Call the middleware with the prepared scope, receive, and send
         await self.app(scope, receive, send)
 
         # Capture the response start and body
-        response_start = send.mock_calls[0][1][0] if send.mock_calls else None
+        response_start = sent[0] if sent else None
 
         self.assertEqual(response_start['status'], 403, "CSRF protection should forbid requests with incorrect content type.")
 
@@ -468,7 +506,7 @@ class CSRFMiddlewareTest(unittest.IsolatedAsyncioTestCase):
         self.assertIn('Rate limit exceeded', str(context.exception))
 
         # Wait for the rate limit window to reset
-        time.sleep((self.app.interval_ms+1)/1000.0)
+        self.clock_ms += self.app.interval_ms + 1
 
         # Attempt the request again after the rate limit period
         response_start, response_body, _ = await self.simulate_request(
@@ -9,6 +9,7 @@
 import os
 import fnmatch
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 
 # Define the original license text
 license_text = """Copyright (c) James Gardner 2024 All Rights Reserved
@@ -60,13 +61,20 @@ old_headers = {
     ".gitignore": generate_old_headers(license_text, "hash"),
 }
 
+# Look up both headers at once by file extension or by file name
+header_lookup = {key: (headers[key], old_headers[key]) for key in headers}
+
 # Function to check if a file is binary
 def is_binary(file_path):
     try:
-        with open(file_path, 'rb') as f:
-            chunk = f.read(1024)  # Read the first 1KB to check for binary data
-            if b'\0' in chunk:  # Check for null bytes in the first 1KB
-                return True
+        # A raw descriptor is enough for one read, no need for a buffered file object
+        fd = os.open(file_path, os.O_RDONLY)
+        try:
+            chunk = os.read(fd, 8000)  # Read the first 8KB to check for binary data
+        finally:
+            os.close(fd)
+        if chunk.find(b'\0') != -1:  # Check for null bytes in the first 8KB
+            return True
     except Exception as e:
         print(f"Error checking if file is binary: {file_path}: {e}")
     return False
@@ -75,22 +83,55 @@ def is_binary(file_path):
 def get_gitignored_files():
     gitignored = set()
     try:
-        result = subprocess.run(['git', 'ls-files', '--others', '--ignored', '--exclude-standard'],
-                                stdout=subprocess.PIPE, text=True)
+        # --directory lists a wholly ignored directory once, as "path/", rather than every file in it
+        result = subprocess.run(['git', 'ls-files', '--others', '--ignored', '--exclude-standard', '--directory'],
+                                stdout=subprocess.PIPE, text=True, check=True)
         gitignored = set(result.stdout.splitlines())
     except Exception as e:
-        print(f"Error fetching gitignored files: {e}")
+        print(f"Error fetching gitignored files, matching .gitignore instead: {e}")
+        gitignored = match_gitignore(".")
     return gitignored
 
-# Check if the header is already present in the file
-def has_header(file_path, header):
+# Check a single .gitignore pattern, roughly as git does
+def gitignore_match(pattern, path, name, is_dir):
+    if pattern.endswith('/'):
+        if not is_dir:
+            return False
+        pattern = pattern[:-1]
+    # Patterns containing a slash are relative to the root, others match the name at any depth
+    if '/' in pattern:
+        return fnmatch.fnmatchcase(path, pattern.lstrip('/'))
+    return fnmatch.fnmatchcase(name, pattern)
+
+# Without git, match the top level .gitignore ourselves, giving the same "dir/" and file entries
+def match_gitignore(root_dir):
+    patterns = []
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read(len(header))
-            return header in content
+        with open(os.path.join(root_dir, '.gitignore'), 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                # Negated patterns aren't supported
+                if line and not line.startswith(('#', '!')):
+                    patterns.append(line)
     except Exception as e:
-        print(f"Error reading file {file_path}: {e}")
-        return False
+        print(f"Error reading .gitignore: {e}")
+        return set()
+
+    gitignored = set()
+    for root, dirs, files in os.walk(root_dir):
+        if '.git' in dirs:
+            dirs.remove('.git')
+        for names, is_dir in ((list(dirs), True), (files, False)):
+            for name in names:
+                path = os.path.relpath(os.path.join(root, name), root_dir)
+                if any(gitignore_match(pattern, path, name, is_dir) for pattern in patterns):
+                    if is_dir:
+                        gitignored.add(path + '/')
+                        # Nothing under an ignored directory needs checking
+                        dirs.remove(name)
+                    else:
+                        gitignored.add(path)
+    return gitignored
 
 # Remove old license headers from the file content
 def remove_old_license(content, old_headers):
@@ -99,11 +140,15 @@ def remove_old_license(content, old_headers):
             content = content.replace(old_header, '')
     return content
 
-# Add header to the file if not present
+# Add header to the file if not present, returning False if it was already there
 def add_header(file_path, header, old_headers):
     try:
         with open(file_path, 'r+', encoding='utf-8') as f:
-            content = f.read()
+            # Check the start of the file and only read the rest if it needs rewriting
+            content = f.read(len(header))
+            if content == header:
+                return False
+            content += f.read()
 
             # Remove any old license headers
             content = remove_old_license(content, old_headers)
@@ -112,16 +157,38 @@ def add_header(file_path, header, old_headers):
             f.write(header + content)
             f.truncate()  # Ensure the file is truncated in case the new content is shorter
             print(f"Header added to {file_path}")
+            return True
     except Exception as e:
         print(f"Error writing to file {file_path}: {e}")
 
+# Process one supported file, returning why it was skipped if it was
+def process_file(item):
+    file_path, header, old_header_list = item
+
+    # Skip binary files
+    if is_binary(file_path):
+        return (file_path, "binary file")
+
+    # Add header to the file, or skip it if it already has the header
+    if add_header(file_path, header, old_header_list) is False:
+        return (file_path, "header already exists")
+
 # Recursively process all files and track skipped files
 def process_files(root_dir, gitignore_files):
     skipped_files = []
+    worklist = []
     for root, dirs, files in os.walk(root_dir):
-        # Skip .git directory
-        if '.git' in dirs:
-            dirs.remove('.git')
+        # Skip .git and don't descend into ignored directories at all
+        kept_dirs = []
+        for d in dirs:
+            dir_path = os.path.join(root, d)
+            if d == '.git':
+                continue
+            if dir_path[2:] + '/' in gitignore_files:
+                skipped_files.append((dir_path, "gitignored"))
+                continue
+            kept_dirs.append(d)
+        dirs[:] = kept_dirs
 
         for file in files:
             file_path = os.path.join(root, file)
@@ -131,28 +198,22 @@ def process_files(root_dir, gitignore_files):
                 skipped_files.append((file_path, "gitignored"))
                 continue
 
-            # Skip binary files
-            if is_binary(file_path):
-                skipped_files.append((file_path, "binary file"))
-                continue
-
             # Determine the correct header based on file extension or name
             ext = os.path.splitext(file)[1]  # Get file extension
-            header = headers.get(ext) or headers.get(file)
-            old_header_list = old_headers.get(ext) or old_headers.get(file)
+            header, old_header_list = header_lookup.get(ext) or header_lookup.get(file) or (None, None)
 
-            # If the file is not supported by any header, skip it
+            # If the file is not supported by any header, skip it before opening it
             if not header:
                 skipped_files.append((file_path, "unsupported file type"))
                 continue
 
-            # If the file already has the header, skip it
-            if has_header(file_path, header):
-                skipped_files.append((file_path, "header already exists"))
-                continue
+            worklist.append((file_path, header, old_header_list))
 
-            # Add header to the file
-            add_header(file_path, header, old_header_list)
+    # Each remaining file is checked and rewritten independently, so overlap the file I/O across threads
+    with ThreadPoolExecutor(max_workers=(os.cpu_count() or 1) * 4) as executor:
+        for skipped in executor.map(process_file, worklist):
+            if skipped:
+                skipped_files.append(skipped)
 
     return skipped_files
 
@@ -12,14 +12,23 @@ import time
 import zipfile
 
 root = '/'.join(__file__.replace('\\', '/').split('/')[:-1])
+root_prefix = root + '/'
+
+MAX_CACHED_SIZE = 65536
 
 if root.endswith('.zip'):
     z = zipfile.ZipFile(root, 'r')
+    # The zip can't change while it is being served so small files only need decompressing once
+    cache = {}
 
     def read(file_path):
-        file_full_path = '/'.join([root, file_path])
+        if file_path in cache:
+            return cache[file_path]
         with z.open(file_path) as f:
-            return f.read()
+            data = f.read()
+        if len(data) <= MAX_CACHED_SIZE:
+            cache[file_path] = data
+        return data
 
     def stat(file_path):
         try:
@@ -29,14 +38,18 @@ if root.endswith('.zip'):
         modified_time = time.mktime(file_info.date_time + (0, 0, -1))  # Convert to epoch
         file_size = file_info.file_size  # Uncompressed file size
         return True, int(modified_time), file_size
+
+    def full_path(file_path):
+        # Files inside the zip have no path on disk
+        return None
 else:
     def read(file_path):
-        file_full_path = '/'.join([root, file_path])
+        file_full_path = root_prefix + file_path
         with open(file_full_path, 'rb') as f:
             return f.read()
 
     def stat(file_path):
-        file_full_path = '/'.join([root, file_path])
+        file_full_path = root_prefix + file_path
         try:
             file_info = os.stat(file_full_path)
             modified_time = file_info.st_mtime  # Time of last modification (epoch seconds)
@@ -44,3 +57,6 @@ else:
             return False, None, None
         file_size = file_info.st_size       # Uncompressed file size
         return True, int(modified_time), file_size
+
+    def full_path(file_path):
+        return root_prefix + file_path
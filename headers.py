@@ -0,0 +1,32 @@
+# Copyright (c) James Gardner 2024 All Rights Reserved
+# This file is licensed under the GNU Lesser General Public License (LGPL) v3.0.
+# You may obtain a copy of the license at http://www.gnu.org/licenses/lgpl-3.0.html.
+# 
+# This software is distributed WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License
+# for more details.
+
+
+# Responses tend to repeat the same sizes, so keep the encoded Content-Length
+# values rather than formatting them every time. Only small sizes are kept so
+# the cache can't grow without limit.
+MAX_CACHED_CONTENT_LENGTH = 65536
+_content_lengths = {}
+
+def content_length(n):
+    value = _content_lengths.get(n)
+    if value is None:
+        value = str(n).encode('ascii')
+        if n < MAX_CACHED_CONTENT_LENGTH:
+            _content_lengths[n] = value
+    return value
+
+
+def header_map(scope):
+    # Each layer would otherwise scan scope['headers'] itself, so build a dict
+    # once per request and share it through the scope. Like dict() the last of
+    # any repeated header wins.
+    headers = scope.get('header_map')
+    if headers is None:
+        headers = scope['header_map'] = dict(scope['headers'])
+    return headers
@@ -10,11 +10,11 @@ from binascii import a2b_base64 as b64decode
 from binascii import b2a_base64
 
 def urlsafe_b64encode_without_padding(data):
-    # Base64 encode the data
-    b64 = b2a_base64(data).rstrip(b'\n')
+    # Base64 encode the data, stripping the newline and padding ('=') together
+    b64 = b2a_base64(data).rstrip(b'\n=')
 
-    # Convert to string, replace URL-unsafe characters (+, /) with (-, _)
+    # Replace URL-unsafe characters (+, /) with (-, _), MicroPython has no bytes.translate()
     url_safe_b64 = b64.replace(b'+', b'-').replace(b'/', b'_')
 
-    # Remove padding ('=') and return as UTF-8 string
-    return url_safe_b64.rstrip(b'=').decode('utf-8')
+    # Return as an ASCII string
+    return url_safe_b64.decode('ascii')
@@ -6,10 +6,17 @@
 # MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License
 # for more details.
 
+# Only used on MicroPython, where this directory is added to sys.path. CPython
+# always gets its own hmac module, which already does the hashing in C.
+
 import hashlib
 
 # Constants
 BLOCK_SIZE = 64  # Block size for SHA-256
+# XOR the whole padded key as one big integer rather than byte by byte
+# (MicroPython has no bytes.translate())
+IPAD = int.from_bytes(b'\x36' * BLOCK_SIZE, 'big')
+OPAD = int.from_bytes(b'\x5c' * BLOCK_SIZE, 'big')
 
 class HMAC:
     def __init__(self, key, msg=None, digestmod=hashlib.sha256):
@@ -26,12 +33,14 @@ class HMAC:
             key = key + b'\x00' * (self.block_size - len(key))
 
         # Create inner and outer paddings
-        self.ipad = bytes((x ^ 0x36) for x in key)
-        self.opad = bytes((x ^ 0x5c) for x in key)
+        key_int = int.from_bytes(key, 'big')
+        self.ipad = (key_int ^ IPAD).to_bytes(self.block_size, 'big')
+        self.opad = (key_int ^ OPAD).to_bytes(self.block_size, 'big')
 
         # Start inner hash
         self.inner = self.digestmod()
         self.inner.update(self.ipad)
+        self.updated = False
 
         if msg is not None:
             self.update(msg)
@@ -39,6 +48,25 @@ class HMAC:
     def update(self, msg):
         """Updates the HMAC object with more message data."""
         self.inner.update(msg)
+        self.updated = True
+
+    def copy(self):
+        """Returns a copy of the HMAC object without repeating the key setup."""
+        other = HMAC.__new__(HMAC)
+        other.digestmod = self.digestmod
+        other.block_size = self.block_size
+        other.ipad = self.ipad
+        other.opad = self.opad
+        other.updated = self.updated
+        if hasattr(self.inner, 'copy'):
+            other.inner = self.inner.copy()
+        elif not self.updated:
+            # MicroPython hashes can't be copied, but a fresh one is the same if nothing has been added yet
+            other.inner = self.digestmod()
+            other.inner.update(self.ipad)
+        else:
+            raise ValueError('Can only copy an HMAC before update() is called on this platform')
+        return other
 
     def digest(self):
         """Returns the HMAC hash as bytes."""
@@ -73,9 +101,5 @@ def compare_digest(a, b):
     if len(a) != len(b):
         return False
 
-    # Perform comparison in constant time
-    result = 0
-    for x, y in zip(a, b):
-        result |= x ^ y
-
-    return result == 0
+    # Perform comparison in constant time, XORing every byte at once as big integers
+    return (int.from_bytes(a, 'big') ^ int.from_bytes(b, 'big')) == 0
@@ -16,8 +16,9 @@ class SimpleCookie:
         """Parses the cookie header."""
         cookies = cookie_header.split(';')
         for cookie in cookies:
-            if '=' in cookie:
-                key, value = cookie.split('=', 1)
+            # One scan finds the '=' and splits on it
+            key, sep, value = cookie.partition('=')
+            if sep:
                 self.cookies[key.strip()] = Morsel(value.strip())
 
     def get(self, key, default=None):
@@ -26,7 +27,11 @@ class SimpleCookie:
 
     def __getitem__(self, key):
         """Gets a cookie by key (like dictionary access)."""
-        return self.cookies.get(key, Morsel())
+        # Only make the empty Morsel on a miss. It isn't shared since callers may set attributes on it.
+        morsel = self.cookies.get(key)
+        if morsel is None:
+            return Morsel()
+        return morsel
 
     def __setitem__(self, key, value):
         """Sets a cookie value."""
@@ -39,7 +44,7 @@ class SimpleCookie:
 
     def output(self, header='', sep='; '):
         """Generates a string suitable for the Cookie HTTP header."""
-        return sep.join([f"{key}={morsel.output()}" for key, morsel in self.cookies.items()])
+        return sep.join([key + '=' + morsel.output() for key, morsel in self.cookies.items()])
 
 class Morsel:
     def __init__(self, value=''):
@@ -51,6 +56,8 @@ class Morsel:
             'samesite': None,
             'max-age': None
         }
+        # The attributes change far less often than output() is called
+        self.suffix = ''
 
     def __getitem__(self, key):
         """Gets an attribute value."""
@@ -60,9 +67,14 @@ class Morsel:
         """Sets an attribute value."""
         if key in self.attributes:
             self.attributes[key] = value
+            self.suffix = self.build_suffix()
 
     def output(self):
         """Returns the value with attributes for the cookie header."""
+        return self.value + self.suffix
+
+    def build_suffix(self):
+        """Formats the attributes, ready to go after the value."""
         attrs = []
         if self.attributes['path']:
             attrs.append(f'Path={self.attributes["path"]}')
@@ -74,7 +86,9 @@ class Morsel:
             attrs.append(f'SameSite={self.attributes["samesite"]}')
         if self.attributes['max-age'] is not None:
             attrs.append(f'Max-Age={self.attributes["max-age"]}')
-        return f'{self.value}; ' + '; '.join(attrs).strip('; ')
+        if not attrs:
+            return ''
+        return '; ' + '; '.join(attrs)
 
 
 if __name__ == '__main__':
@@ -15,26 +15,32 @@ def get_extension_mimetype_mapping(directory):
     # Dictionary to hold the extension -> mime type mapping
     ext_to_mime = {}
 
-    # Walk through the directory and its subdirectories
-    for root, dirs, files in os.walk(directory):
-        for file in files:
-            # Get the file extension in lowercase
-            file_ext = os.path.splitext(file)[1].lower()
+    # Walk through the directory and its subdirectories, only file names are needed so no paths are joined
+    directories = [directory]
+    while directories:
+        with os.scandir(directories.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    # Like os.walk, don't follow symlinks to directories
+                    if not entry.is_symlink():
+                        directories.append(entry.path)
+                    continue
+
+                # Get the file extension in lowercase
+                file_ext = os.path.splitext(entry.name)[1].lower()
+
+                # Each extension only needs guessing once
+                if file_ext in ext_to_mime:
+                    continue
+
+                # Guess the MIME type from the extension alone, so every file with it gets the same answer
+                mime_type, _ = mimetypes.guess_type('file' + file_ext)
+
+                # If mime_type is None, we set it to "application/octet-stream"
+                if mime_type is None:
+                    mime_type = "application/octet-stream"
 
-            # Guess the MIME type using mimetypes
-            mime_type, _ = mimetypes.guess_type(file)
-
-            # If mime_type is None, we set it to "application/octet-stream"
-            if mime_type is None:
-                mime_type = "application/octet-stream"
-
-            # Update the dictionary
-            if file_ext not in ext_to_mime:
                 ext_to_mime[file_ext] = mime_type
-            else:
-                # If the extension exists, ensure no conflicts in mime types
-                if ext_to_mime[file_ext] != mime_type:
-                    print(f"Warning: Extension {file_ext} maps to multiple MIME types ({ext_to_mime[file_ext]} and {mime_type})")
 
     return ext_to_mime
 
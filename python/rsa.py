@@ -14,8 +14,7 @@ python3 test.py
 
 import os
 import ctypes
-import base64
-import hashlib
+from binascii import b2a_base64
 from ctypes import POINTER, c_int, c_void_p, c_char_p, c_size_t
 
 # Load OpenSSL shared library
@@ -23,40 +22,78 @@ libcrypto = ctypes.cdll.LoadLibrary(os.environ['LIBCRYPTO'])
 
 
 # Define argument and return types for the OpenSSL functions we'll use
-libcrypto.RSA_sign.argtypes = [c_int, ctypes.c_char_p, c_size_t, ctypes.c_char_p, POINTER(c_int), c_void_p]
-libcrypto.RSA_sign.restype = c_int
+libcrypto.EVP_sha256.argtypes = []
+libcrypto.EVP_sha256.restype = c_void_p
 
-libcrypto.RSA_verify.argtypes = [c_int, ctypes.c_char_p, c_size_t, ctypes.c_char_p, c_size_t, c_void_p]
-libcrypto.RSA_verify.restype = c_int
+libcrypto.EVP_MD_CTX_new.argtypes = []
+libcrypto.EVP_MD_CTX_new.restype = c_void_p
+
+libcrypto.EVP_MD_CTX_reset.argtypes = [c_void_p]
+libcrypto.EVP_MD_CTX_reset.restype = c_int
+
+libcrypto.EVP_DigestSignInit.argtypes = [c_void_p, c_void_p, c_void_p, c_void_p, c_void_p]
+libcrypto.EVP_DigestSignInit.restype = c_int
+
+libcrypto.EVP_DigestSign.argtypes = [c_void_p, c_char_p, POINTER(c_size_t), c_char_p, c_size_t]
+libcrypto.EVP_DigestSign.restype = c_int
+
+libcrypto.EVP_DigestVerifyInit.argtypes = [c_void_p, c_void_p, c_void_p, c_void_p, c_void_p]
+libcrypto.EVP_DigestVerifyInit.restype = c_int
+
+libcrypto.EVP_DigestVerify.argtypes = [c_void_p, c_char_p, c_size_t, c_char_p, c_size_t]
+libcrypto.EVP_DigestVerify.restype = c_int
 
 libcrypto.BIO_new_mem_buf.argtypes = [c_void_p, c_int]
 libcrypto.BIO_new_mem_buf.restype = c_void_p
 
-libcrypto.PEM_read_bio_RSAPrivateKey.argtypes = [c_void_p, POINTER(c_void_p), c_void_p, c_void_p]
-libcrypto.PEM_read_bio_RSAPrivateKey.restype = c_void_p
+libcrypto.PEM_read_bio_PrivateKey.argtypes = [c_void_p, POINTER(c_void_p), c_void_p, c_void_p]
+libcrypto.PEM_read_bio_PrivateKey.restype = c_void_p
 
-libcrypto.PEM_read_bio_RSA_PUBKEY.argtypes = [c_void_p, POINTER(c_void_p), c_void_p, c_void_p]
-libcrypto.PEM_read_bio_RSA_PUBKEY.restype = c_void_p
+libcrypto.PEM_read_bio_PUBKEY.argtypes = [c_void_p, POINTER(c_void_p), c_void_p, c_void_p]
+libcrypto.PEM_read_bio_PUBKEY.restype = c_void_p
 
 libcrypto.BIO_free.argtypes = [c_void_p]
 libcrypto.BIO_free.restype = c_int
 
-NID_sha256 = 672  # This is the identifier for SHA-256
 
+sha256 = libcrypto.EVP_sha256()
+
+# One digest context per key, reset between uses rather than allocated and freed every time
+contexts = {}
 
+
+def key_context(key):
+    ctx = contexts.get(key)
+    if ctx is None:
+        ctx = libcrypto.EVP_MD_CTX_new()
+        if not ctx:
+            raise Exception("EVP_MD_CTX_new failed")
+        contexts[key] = ctx
+    elif libcrypto.EVP_MD_CTX_reset(ctx) != 1:
+        raise Exception("EVP_MD_CTX_reset failed")
+    return ctx
+
+
+# OpenSSL hashes and signs in one call so the message is only passed over once
 def rsa_sign(private_key, message):
-    digest = hashlib.sha256(message).digest()
-    siglen = c_int()
-    signature = ctypes.create_string_buffer(256)  # Adjust size for key length
-    result = libcrypto.RSA_sign(NID_sha256, digest, len(digest), signature, ctypes.byref(siglen), private_key)
-    if result != 1:
-        raise Exception("RSA_sign failed")
+    ctx = key_context(private_key)
+    if libcrypto.EVP_DigestSignInit(ctx, None, sha256, None, private_key) != 1:
+        raise Exception("EVP_DigestSignInit failed")
+    # A first call without a buffer gives the signature size for the key
+    siglen = c_size_t()
+    if libcrypto.EVP_DigestSign(ctx, None, ctypes.byref(siglen), message, len(message)) != 1:
+        raise Exception("EVP_DigestSign failed")
+    signature = ctypes.create_string_buffer(siglen.value)
+    if libcrypto.EVP_DigestSign(ctx, signature, ctypes.byref(siglen), message, len(message)) != 1:
+        raise Exception("EVP_DigestSign failed")
     return signature.raw[:siglen.value]
 
 
 def rsa_verify(public_key, message, signature):
-    digest = hashlib.sha256(message).digest()
-    result = libcrypto.RSA_verify(NID_sha256, digest, len(digest), signature, len(signature), public_key)
+    ctx = key_context(public_key)
+    if libcrypto.EVP_DigestVerifyInit(ctx, None, sha256, None, public_key) != 1:
+        raise Exception("EVP_DigestVerifyInit failed")
+    result = libcrypto.EVP_DigestVerify(ctx, signature, len(signature), message, len(message))
     return result == 1
 
 
@@ -68,7 +105,7 @@ def load_private_key(filepath):
     if not bio:
         raise Exception("Failed to create BIO for private key")
     
-    private_key = libcrypto.PEM_read_bio_RSAPrivateKey(bio, None, None, None)
+    private_key = libcrypto.PEM_read_bio_PrivateKey(bio, None, None, None)
     libcrypto.BIO_free(bio)
     
     if not private_key:
@@ -85,7 +122,7 @@ def load_public_key(filepath):
     if not bio:
         raise Exception("Failed to create BIO for public key")
     
-    public_key = libcrypto.PEM_read_bio_RSA_PUBKEY(bio, None, None, None)
+    public_key = libcrypto.PEM_read_bio_PUBKEY(bio, None, None, None)
     libcrypto.BIO_free(bio)
     
     if not public_key:
@@ -94,9 +131,12 @@ def load_public_key(filepath):
     return public_key
 
 
+URLSAFE_TRANS = bytes.maketrans(b'+/', b'-_')
+
+
 def base64_url_encode(data):
     """Base64 URL encode the data."""
-    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('utf-8')
+    return b2a_base64(data, newline=False).translate(URLSAFE_TRANS).rstrip(b'=').decode('ascii')
 
 
 # Load keys
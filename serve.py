@@ -13,6 +13,12 @@ import sys
 import time
 import traceback
 
+# A faster event loop is used when one is installed, each worker process runs its own
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
 # Weekday and month names for HTTP date/time formatting; always English!
 _weekdayname = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
 _monthname = [None, # Dummy so we can use 1-based month numbers
@@ -25,18 +31,64 @@ def format_date_time(timestamp):
         _weekdayname[wd], day, _monthname[month], year, hh, mm, ss
     )
 
+# Status lines for the common statuses, others are made as needed
+status_lines = {
+    200: b"HTTP/1.1 200 OK\r\n",
+    206: b"HTTP/1.1 206 Partial Content\r\n",
+    301: b"HTTP/1.1 301 Moved Permanently\r\n",
+    302: b"HTTP/1.1 302 Found\r\n",
+    304: b"HTTP/1.1 304 Not Modified\r\n",
+    400: b"HTTP/1.1 400 Bad Request\r\n",
+    401: b"HTTP/1.1 401 Unauthorized\r\n",
+    403: b"HTTP/1.1 403 Forbidden\r\n",
+    404: b"HTTP/1.1 404 Not Found\r\n",
+    405: b"HTTP/1.1 405 Method Not Allowed\r\n",
+    500: b"HTTP/1.1 500 Internal Server Error\r\n",
+}
+
+def status_line(status):
+    line = status_lines.get(status)
+    if line is None:
+        # The reason phrase is optional but the space before it isn't
+        line = b"HTTP/1.1 " + str(status).encode("ascii") + b" \r\n"
+    return line
+
+# The date only changes once a second so format it once for all the responses in that second
+date_cache = [None, b""]
+
+def date_header():
+    now = int(time.time())
+    if now != date_cache[0]:
+        date_cache[0] = now
+        date_cache[1] = b"Date: " + format_date_time(now).encode("ascii") + b"\r\n"
+    return date_cache[1]
+
+# The stock asyncio loop can copy files straight from the page cache to the
+# socket with loop.sendfile(), so offer the ASGI extensions that use it.
+# MicroPython and uvloop don't have it.
+if sys.implementation.name == 'micropython' or uvloop is not None:
+    extensions = {}
+else:
+    extensions = {"http.response.pathsend": {}, "http.response.zerocopysend": {}}
+
+# Request bodies are handed to the application in pieces of at most this size
+BODY_CHUNK_SIZE = 65536
+
 DEV = LOGGING = False
 if LOGGING:
     info = print
 log = error = print
 
 
-def create_socket(address):
+def create_socket(address, reuse_port=False):
     try:
         host, port = address.split(":")
         port = int(port)
         sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if reuse_port:
+            # Lets each worker bind its own socket so the kernel spreads connections between them
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
         sock.bind((host, port))
     except OSError as e:
         error("Failed to create TCP Socket:", e)
@@ -55,32 +107,92 @@ def create_socket(address):
     return sock
 
 
+# Methods as they usually arrive, already upper case
+methods = {
+    m.encode("ascii"): m
+    for m in ["GET", "HEAD", "POST", "PUT", "DELETE", "OPTIONS", "PATCH", "TRACE", "CONNECT"]
+}
+
+
+# Header names as they usually arrive mapped to their lower case form, so the
+# common ones skip lower() and strip() and share one key object
+common_headers = {
+    name.encode("ascii"): name.lower().encode("ascii")
+    for name in [
+        "Host", "Connection", "Content-Length", "Content-Type", "Transfer-Encoding",
+        "Accept", "Accept-Encoding", "Accept-Language", "User-Agent", "Cookie",
+        "Authorization", "If-None-Match", "If-Modified-Since", "Referer", "Origin",
+        "Cache-Control", "Upgrade-Insecure-Requests",
+    ]
+}
+common_headers.update({key: key for key in list(common_headers.values())})
+
+
 class BadRequest(Exception):
     pass
 
 
-async def headers(reader):
+max_headers_length = 1024 * 1024
+
+
+async def request_head(reader):
+    # The request line and the headers up to and including the blank line
+    if sys.implementation.name == 'micropython':
+        # No readuntil() so gather the lines one at a time
+        line = await reader.readline()
+        if not line:
+            return line
+        lines = [line]
+        size = len(line)
+        while True:
+            line = await reader.readline()
+            if not line:
+                raise BadRequest("Connection closed in the headers")
+            lines.append(line)
+            if line == b"\r\n":
+                return b"".join(lines)
+            size += len(line)
+            if len(lines) > 1001 or size > max_headers_length:
+                raise BadRequest(
+                    f"Could not find end of headers after reading 1000 lines or {max_headers_length} bytes."
+                )
+    # Read it all in one go rather than a readline() per header
+    try:
+        return await reader.readuntil(b"\r\n\r\n")
+    except asyncio.IncompleteReadError as e:
+        if not e.partial:
+            # Closed between requests
+            return b""
+        raise BadRequest("Connection closed in the headers")
+    except asyncio.LimitOverrunError:
+        raise BadRequest("Headers too long")
+
+
+def headers(block, pos):
     found = []
+    # Index the headers as they are read so nothing needs to scan the list again
+    found_map = {}
+    end = len(block)
     counter = 0
-    size = 0
-    max_headers_length = 1024 * 1024
-    while counter < 1000 and size < max_headers_length:
-        line = await reader.readline()
-        if LOGGING:
-            info(line)
-        if line == b"\r\n":
+    while counter < 1000 and pos < end:
+        nl = block.find(b"\n", pos) + 1
+        if nl == 0:
+            nl = end
+        if nl - pos == 2 and block[pos] == 13:  # b"\r"
             # End of headers
-            return found
-        if len(line) < 4:
-            raise BadRequest(f"Invalid header: {line}")
-        size += len(line)
+            return found, found_map
+        if nl - pos < 4:
+            raise BadRequest(f"Invalid header: {block[pos:nl]}")
         counter += 1
-        first = line.find(b":")
+        first = block.find(b":", pos, nl)
         if first < 0:
             raise BadRequest("Invalid header line")
-        key = line[:first].lower().strip()
-        value = line[first + 1 :].strip()
+        key = block[pos:first]
+        key = common_headers.get(key) or key.lower().strip()
+        value = block[first + 1 : nl].strip()
         found.append((key, value))
+        found_map[key] = value
+        pos = nl
     raise BadRequest(
         f"Could not find end of headers after reading 1000 lines or {max_headers_length} bytes."
     )
@@ -91,23 +203,39 @@ def handle_connection(application):
     async def handle_connection_run(reader, writer):
         try:
             while True:
-                line = await reader.readline()
+                head = await request_head(reader)
                 if LOGGING:
-                    info(line)
-                if not line:
+                    info(head)
+                if not head:
                     writer.close()
                     break
-                try:
-                    raw_method, raw_path, raw_http_version = line.strip().split(b" ")
-                except Exception as e:
-                    raise BadRequest(str(e))
+                # Find the two spaces rather than stripping and splitting into a new list
+                end = head.find(b"\n") + 1
+                line = head[:end]
+                if line.endswith(b"\r\n"):
+                    end -= 2
+                else:
+                    end -= 1
+                first = line.find(b" ", 0, end)
+                second = line.find(b" ", first + 1, end)
+                if first < 0 or second < 0 or line.find(b" ", second + 1, end) >= 0:
+                    raise BadRequest(f"Invalid request line: {line}")
+                raw_method = line[:first]
+                raw_path = line[first + 1 : second]
+                raw_http_version = line[second + 1 : end]
+                method = methods.get(raw_method)
+                if method is None:
+                    method = raw_method.decode("utf8").upper()
+                found, found_map = headers(head, len(line))
                 scope = {
                     "type": "http",
                     "asgi": {"version": "3.0", "spec_version": "2.3"},
                     "http_version": raw_http_version.decode("utf8")[5:],
-                    "method": raw_method.decode("utf8").upper(),
+                    "method": method,
                     "raw_path": raw_path,
-                    "headers": await headers(reader),
+                    "headers": found,
+                    "header_map": found_map,
+                    "extensions": extensions,
                 }
                 pos = scope["raw_path"].find(b"?")
                 if pos == 0:
@@ -121,50 +249,58 @@ def handle_connection(application):
                 else:
                     scope["path"] = scope["raw_path"].decode("utf8")
 
+                remaining = [0]
+                content_length = found_map.get(b"content-length")
+                if content_length is not None:
+                    if not content_length.isdigit():
+                        raise BadRequest(f"Invalid content length: {content_length}")
+                    remaining[0] = int(content_length)
+
                 async def receive():
+                    # Read the body as the application asks for it rather than all at once
+                    size = min(remaining[0], BODY_CHUNK_SIZE)
                     body = b""
-                    for k, v in scope["headers"]:
-                        if k == b"content-length":
-                            body = await reader.read(int(v.decode("ascii")))
+                    if size:
+                        body = await reader.readexactly(size)
+                        remaining[0] -= size
                     return {
                         "type": "http.request",
                         "body": body,
-                        "more_body": False,
+                        "more_body": remaining[0] > 0,
                     }
 
                 started = [False]
-                connection = [None]
-                to_send = [b""]
+                connection = found_map.get(b"connection")
+                if connection is not None:
+                    connection = connection.lower()
+                # Collect the pieces and join once, appending to bytes would copy everything so far each time
+                to_send = []
                 should_close = [False]
 
-                for k, v in scope["headers"]:
-                    if k.lower().strip() == b"connection":
-                        connection[0] = v.lower()
-
                 async def send(event):
                     if event["type"] == "http.response.start":
-                        response = b"HTTP/1.1 " + str(event.get("status", 200)).encode('ascii') + b"\r\n"
+                        # Extend one buffer rather than making new bytes for every header
+                        response = bytearray(status_line(event.get("status", 200)))
                         started[0] = True
                         for k, v in event["headers"]:
-                            response += k + b": " + v + b"\r\n"
+                            response += k
+                            response += b": "
+                            response += v
+                            response += b"\r\n"
                         if scope["http_version"] == "1.0":
-                            if connection[0] == b"keep-alive":
+                            if connection == b"keep-alive":
                                 response += b"Connection: Keep-Alive\r\n"
                             else:
                                 should_close[0] = True
-                        elif connection[0] == b"close":
+                        elif connection == b"close":
                             response += b"Connection: Close\r\n"
                             should_close[0] = True
-                        response += (
-                            b"Date: "
-                            + (format_date_time(time.time()).encode("utf8"))
-                            + b"\r\n"
-                        )
+                        response += date_header()
                         # response += b"Server: pyvicorn\r\n"
                         response += b"\r\n"
                         if LOGGING:
                             info(response)
-                        to_send[0] += response
+                        to_send.append(bytes(response))
                     elif event["type"] == "http.response.body":
                         if not started[0]:
                             raise Exception(
@@ -174,17 +310,35 @@ def handle_connection(application):
                         if body:
                             if LOGGING:
                                 info(body)
-                            to_send[0] += body
+                            to_send.append(body)
+                    elif event["type"] == "http.response.zerocopysend":
+                        await send_file(event["file"], event.get("offset", 0), event.get("count"))
+                    elif event["type"] == "http.response.pathsend":
+                        with open(event["path"], "rb") as f:
+                            await send_file(f, 0, None)
                     else:
                         raise Exception("Unknown event type")
 
+                async def send_file(f, offset, count):
+                    if not started[0]:
+                        raise Exception(
+                            "Expected the http.responsie.start event to be sent first"
+                        )
+                    # The head has to go out before the file
+                    writer.write(b"".join(to_send))
+                    to_send.clear()
+                    await asyncio.get_running_loop().sendfile(writer.transport, f, offset, count)
+
                 await application(scope, receive, send)
-                writer.write(to_send[0])
+                writer.write(b"".join(to_send))
                 if should_close[0]:
                     if LOGGING:
                         info("Close the connection")
                     writer.close()
                     break
+                # Skip any body the application didn't read so the next request starts in the right place
+                while remaining[0]:
+                    await receive()
         # except ConnectionResetError:
         #     # The connection is already closed, nothing to do
         #     if LOGGING:
@@ -206,6 +360,9 @@ def handle_connection(application):
 
 # https://docs.python.org/3/library/asyncio-stream.html#tcp-echo-server-using-streams
 async def serve(num, application, p):
+    if sys.implementation.name != 'micropython':
+        # readuntil() in request_head() stops at the reader's limit, which is only 64 KiB by default
+        p = dict(p, limit=max_headers_length)
     server = await asyncio.start_server(handle_connection(application), **p)
     if sys.implementation.name == 'micropython':
         log(f"Serving worker 1")
@@ -215,7 +372,12 @@ async def serve(num, application, p):
     await server.wait_closed()
 
 def run_worker(num, application, p):
-    asyncio.run(serve(num, application, p))
+    if "address" in p:
+        p = dict(sock=create_socket(p["address"], reuse_port=True))
+    if uvloop is not None:
+        uvloop.run(serve(num, application, p))
+    else:
+        asyncio.run(serve(num, application, p))
 
 def main(application, address, num_workers):
     if sys.implementation.name == 'micropython':
@@ -224,16 +386,23 @@ def main(application, address, num_workers):
         p = dict(host=host, port=port)
         assert num_workers == 1, 'Only one worker allowed in micropython'
     else:
-        sock = create_socket(address)
+        reuse_port = num_workers != 1 and hasattr(socket, "SO_REUSEPORT")
+        sock = create_socket(address, reuse_port)
         p = dict(sock=sock)
     if num_workers != 1:
         workers = []
+        # Other workers bind their own TCP sockets where they can, otherwise they share this one
+        worker_p = p
+        if reuse_port and sock.family == socket.AF_INET:
+            worker_p = dict(address=address)
+            # A forked worker would otherwise keep this socket open without ever accepting on it
+            os.register_at_fork(after_in_child=sock.close)
         try:
             import multiprocessing
             # Run all but one in separate processes
             for i in range(num_workers - 1):
                 worker = multiprocessing.Process(
-                    target=run_worker, args=(i + 2, application, p)
+                    target=run_worker, args=(i + 2, application, worker_p)
                 )
                 worker.daemon = True
                 worker.start()
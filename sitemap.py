@@ -6,7 +6,7 @@
 # MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License
 # for more details.
 
-from tags import tag
+from tags import tag, tag2html
 
 
 class Page:
@@ -45,31 +45,37 @@ def extract_hierarchy(nav, parent=None, section_index=None, page_index=None, par
     if page_index is None:
         page_index = {}
 
-    # If this is a section, set the parent and determine the path
-    if isinstance(nav, Section):
-        nav.set_parent(parent)
+    # Walk the tree with a stack rather than recursing, children are pushed in
+    # reverse so they come off in order
+    stack = [(nav, parent, parent_page)]
+    while stack:
+        node, parent, parent_page = stack.pop()
 
-        # Find the first child page's path to set as the section's path
-        first_page = next((child for child in nav.children if isinstance(child, Page)), None)
-        if first_page:
-            nav.path = first_page.path
-            section_index[nav.path] = nav
+        # If this is a section, set the parent and determine the path
+        if isinstance(node, Section):
+            node.set_parent(parent)
 
-        # Recurse for children, passing the current section as parent
-        for child in nav.children:
-            extract_hierarchy(child, nav, section_index, page_index)
+            # Find the first child page's path to set as the section's path
+            for child in node.children:
+                if isinstance(child, Page):
+                    node.path = child.path
+                    section_index[node.path] = node
+                    break
 
-    elif isinstance(nav, Page):
-        # Set parent section and parent page (if any)
-        nav.set_parents(parent, parent_page)
+            # Children of a section have it as their parent and no parent page
+            for child in reversed(node.children):
+                stack.append((child, node, None))
 
-        # Add the page to the page index
-        page_index[nav.path] = nav
+        elif isinstance(node, Page):
+            # Set parent section and parent page (if any)
+            node.set_parents(parent, parent_page)
 
-        # Recurse for children in a page (if any)
-        if nav.children:
-            for child in nav.children:
-                extract_hierarchy(child, parent, section_index, page_index, nav)
+            # Add the page to the page index
+            page_index[node.path] = node
+
+            # Children of a page share its section and have it as their parent page
+            for child in reversed(node.children):
+                stack.append((child, parent, node))
 
     return section_index, page_index
 
@@ -79,20 +85,21 @@ def breadcrumbs(page_index, path):
     section = page_index[path].section
     if section.parent is None:
         return tag([])
-    breadcrumbs_list = [[section.title, section.path, False]]  # Collect the current section
-    # Traverse the parent section hierarchy upwards
-    while section.parent is not None:
+    # Walk up the sections once, the first one that isn't this page is the parent link
+    breadcrumbs_list = []
+    found_parent_link = False
+    while section is not None:
+        is_parent_link = not found_parent_link and path != section.path
+        if is_parent_link:
+            found_parent_link = True
+        breadcrumbs_list.append((section.title, section.path, is_parent_link))
         section = section.parent
-        breadcrumbs_list.append([section.title, section.path, False])  # Append each parent section
-    for breadcrumb in breadcrumbs_list:
-        if path != breadcrumb[1]:
-            breadcrumb[2] = True
-            break
+    breadcrumbs_list.reverse()
     # Generate the <ul> with <li> and <a> tags for breadcrumbs
     return tag('ul', {'class': 'breadcrumbs'}, [
         tag('li', {'class': is_parent_link and 'is_parent_link' or None}, [
             path == breadcrumb_path and tag('span', {}, title) or tag('a', {'href': breadcrumb_path}, title)
-        ]) for title, breadcrumb_path, is_parent_link in reversed(breadcrumbs_list)  # Reverse to get correct order
+        ]) for title, breadcrumb_path, is_parent_link in breadcrumbs_list
     ])
 
 
@@ -129,11 +136,23 @@ def section_nav(page_index, path):
 
 
 class PageNav:
-    def __init__(self, nav, page_index, section_index, path):
+    def __init__(self, nav, page_index, section_index, path, rendered=None):
         self.nav = nav
         self.page_index = page_index
         self.section_index = section_index
         self.path = path
+        self.rendered = rendered if rendered is not None else {}
+
+    def render_bytes(self, indent=''):
+        # Paths not in the index all render the same empty nav so share one entry
+        key = (self.path if self.path in self.page_index else None, indent)
+        if key not in self.rendered:
+            self.rendered[key] = tag2html(tag([
+                self.main_nav(),
+                self.breadcrumbs(),
+                self.section_nav(),
+            ]), indent=indent).encode('utf8')
+        return self.rendered[key]
 
     def breadcrumbs(self):
         if self.path not in self.page_index:
@@ -156,11 +175,20 @@ class NavMiddleware:
         self.app = app
         self.nav = nav
         self.section_index, self.page_index = extract_hierarchy(nav)
+        self.rendered = {}
+        # The nav never changes so each known page can share one PageNav
+        self.page_navs = {
+            path: PageNav(nav, self.page_index, self.section_index, path, self.rendered)
+            for path in self.page_index
+        }
         print(self.page_index)
 
     async def __call__(self, scope, receive, send):
         assert 'nav' not in scope
-        scope['nav'] = PageNav(self.nav, self.page_index, self.section_index, scope['path'])
+        page_nav = self.page_navs.get(scope['path'])
+        if page_nav is None:
+            page_nav = PageNav(self.nav, self.page_index, self.section_index, scope['path'], self.rendered)
+        scope['nav'] = page_nav
         await self.app(scope, receive, send)
 
 
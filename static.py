@@ -13,41 +13,73 @@ import os
 import json
 
 import fileio
+from headers import header_map
 
 def is_valid_etag(weak_etag, if_none_matched):
+    # Both are bytes. Work out the forms that match once, not for every candidate
     weak_etag = weak_etag.strip()
-    if_none_matched = [etag.strip() for etag in if_none_matched.split(",")]
-    weak_etag_no_prefix = weak_etag[2:] if weak_etag.startswith("W/") else weak_etag
-    for etag in if_none_matched:
-        if (
-            etag == weak_etag
-            or etag == weak_etag_no_prefix
-            or etag == f"W/{weak_etag_no_prefix}"
-        ):
+    weak_etag_no_prefix = weak_etag[2:] if weak_etag.startswith(b"W/") else weak_etag
+    matches = (weak_etag, weak_etag_no_prefix, b"W/" + weak_etag_no_prefix)
+    for etag in if_none_matched.split(b","):
+        etag = etag.strip()
+        if etag in matches:
             return True
     return False
 
+MAX_CACHED_PATHS = 4096
+
+# Redirects and 304s all end with the same empty body so share one message
+EMPTY_BODY = {"type": "http.response.body", "body": b""}
+
 class StaticFilesMiddleware:
-    def __init__(self, app, public_dir, mimetypes_file):
+    def __init__(self, app, public_dir, mimetypes_file, enable_zerocopysend=False):
         self.app = app
+        self.enable_zerocopysend = enable_zerocopysend
         self.public = Path(public_dir) #//.resolve()
-        self.mimetypes = json.loads(fileio.read(mimetypes_file).decode('utf8')) # Prepared with mimetypes_cli.py
+        mimetypes = json.loads(fileio.read(mimetypes_file).decode('utf8')) # Prepared with mimetypes_cli.py
+        # Ready to go straight into the content-type header
+        self.mimetypes = {ext.lower(): mime_type.encode() for ext, mime_type in mimetypes.items()}
+        # The ETag, type and headers only change when the file does, keyed by path
+        self.file_cache = {}
+        # Request paths already worked out, oldest first
+        self.paths = {}
+        public_full_path = fileio.full_path(str(self.public))
+        self.public_real = public_full_path and os.path.join(os.path.realpath(public_full_path), '')
 
     async def __call__(self, scope, receive, send):
         if scope["type"] != "http" or scope["method"] != 'GET':
             return await self.app(scope, receive, send)
         await self.handle_static_file(scope, receive, send)
 
-    async def handle_static_file(self, scope, receive, send):
-        path = Path(urllib.parse.unquote(scope["path"]).lstrip("/"))
-        headers = {key.decode().lower(): value for key, value in scope["headers"]}
-        if_none_match = headers.get("if-none-match")
+    def resolve(self, request_path):
+        # Most requests repeat a few paths so remember where each one leads
+        resolved = self.paths.get(request_path)
+        if resolved is None:
+            path = request_path
+            # Most paths have nothing to unquote
+            if "%" in path:
+                path = urllib.parse.unquote(path)
+            # Collapse any .. segments as a string so they can be checked without touching the disk
+            path = os.path.normpath(path.lstrip("/"))
+            if path == ".." or path.startswith("../"):
+                # Outside the public directory
+                resolved = False
+            else:
+                # Combine with the public directory
+                path = Path(path)
+                file_path = self.public / path
+                resolved = (path, file_path, str(file_path))
+            if len(self.paths) >= MAX_CACHED_PATHS:
+                del self.paths[next(iter(self.paths))]
+            self.paths[request_path] = resolved
+        return resolved
 
-        # Combine with the public directory and resolve the full path
-        file_path = self.public / path # // .resolve()
+    async def handle_static_file(self, scope, receive, send):
+        resolved = self.resolve(scope["path"])
+        if_none_match = header_map(scope).get(b"if-none-match")
 
         # Security check to prevent serving files outside the public directory
-        if not file_path.is_relative_to(self.public):
+        if not resolved:
             await send({
                 "type": "http.response.start",
                 "status": 400,
@@ -56,6 +88,8 @@ class StaticFilesMiddleware:
             await send({"type": "http.response.body", "body": b"Bad Request"})
             return
 
+        path, file_path, key = resolved
+
         if file_path.is_dir():
             if (file_path / "index.html").is_file():
                 location = f"{path}/index.html"
@@ -67,37 +101,72 @@ class StaticFilesMiddleware:
                         (b"content-length", b"0")
                     ],
                 })
-                await send({"type": "http.response.body", "body": b""})
+                await send(EMPTY_BODY)
                 return
             else:
                 await self.app(scope, receive, send)
                 return
 
-        exists, mtime, size = fileio.stat(str(file_path))
+        exists, mtime, size = fileio.stat(key)
         if not exists:
             return await self.app(scope, receive, send)
-           
-        etag = hashlib.md5(f"{mtime}{size}".encode()).hexdigest()
-        weak_etag = f'W/"{etag}"'
-        mime_type = self.mimetypes.get(os.path.splitext(file_path)[1].lower(), "application/octet-stream")
 
-        if if_none_match and is_valid_etag(weak_etag, if_none_match.decode("utf8")):
+        real_path = None
+        if self.public_real:
+            # A symlink could lead outside the public directory, don't serve it by any route
+            real_path = os.path.realpath(fileio.full_path(key))
+            if not (os.path.isabs(real_path) and real_path.startswith(self.public_real)):
+                await send({
+                    "type": "http.response.start",
+                    "status": 404,
+                    "headers": [(b"content-length", b"9")],
+                })
+                await send({"type": "http.response.body", "body": b"Not Found"})
+                return
+
+        cached = self.file_cache.get(key)
+        if cached is None or cached[0] != mtime or cached[1] != size:
+            # Only an identifier, a 128 bit blake2b is plenty and quicker than md5
+            etag = hashlib.blake2b(f"{mtime}{size}".encode(), digest_size=16).hexdigest()
+            weak_etag = f'W/"{etag}"'.encode()
+            mime_type = self.mimetypes.get(os.path.splitext(key)[1].lower(), b"application/octet-stream")
+            cached = self.file_cache[key] = (mtime, size, weak_etag, (
+                (b"content-length", str(size).encode()),
+                (b"content-type", mime_type),
+                (b"etag", weak_etag),
+            ))
+        weak_etag = cached[2]
+
+        if if_none_match and is_valid_etag(weak_etag, if_none_match):
             print('304 for', path)
             await send({
                 "type": "http.response.start",
                 "status": 304,
-                "headers": [
-                    (b"etag", weak_etag.encode())
-                ],
+                "headers": [cached[3][2]],
             })
-            await send({"type": "http.response.body", "body": b""})
+            await send(EMPTY_BODY)
             return
 
-        response_headers = [
-            (b"content-length", str(size).encode()),
-            (b"content-type", mime_type.encode()),
-            (b"etag", weak_etag.encode()),
-        ]
+        # A fresh list each time as later middleware may add to it
+        response_headers = list(cached[3])
+
+        extensions = scope.get("extensions", {})
+        pathsend = "http.response.pathsend" in extensions
+        zerocopysend = self.enable_zerocopysend and "http.response.zerocopysend" in extensions
+        if not (pathsend or zerocopysend):
+            real_path = None
+
+        if real_path and not pathsend:
+            # Open before starting the response so a failure can still become a 500
+            with open(real_path, 'rb') as f:
+                await send({
+                    "type": "http.response.start",
+                    "status": 200,
+                    "headers": response_headers,
+                })
+                print('200 for', path)
+                await send({"type": "http.response.zerocopysend", "file": f, "more_body": False})
+            return
 
         await send({
             "type": "http.response.start",
@@ -106,6 +175,9 @@ class StaticFilesMiddleware:
         })
 
         print('200 for', path)
+        if real_path:
+            await send({"type": "http.response.pathsend", "path": real_path})
+            return
         # XXX Should use chunking really.
         # with file_path.open("rb") as file:
         #     while True:
@@ -113,5 +185,5 @@ class StaticFilesMiddleware:
         #         if not chunk:
         #             break
         #        await send({"type": "http.response.body", "body": chunk, "more_body": True})
-        await send({"type": "http.response.body", "body": fileio.read(str(file_path)), "more_body": False})
+        await send({"type": "http.response.body", "body": fileio.read(key), "more_body": False})
 
@@ -22,7 +22,7 @@ The gzipped files are similarly handled by resolving publicgz_path when self.pub
 ETag Handling
 
 ETag Generation:
-ETags are generated using hashlib.md5(f"{file_path.stat().st_mtime}{file_path.stat().st_size}".encode()).hexdigest(). This method correctly bases the ETag on the file's modification time (st_mtime) and size (st_size), ensuring that any change in the file will produce a new ETag.
+ETags are generated using hashlib.blake2b(f"{file_path.stat().st_mtime}{file_path.stat().st_size}".encode(), digest_size=16).hexdigest(). This method correctly bases the ETag on the file's modification time (st_mtime) and size (st_size), ensuring that any change in the file will produce a new ETag.
 Consistency for Gzipped Files: The current implementation uses different paths (public vs. publicgz) to generate the ETag. However, the ETag should be consistent for both the gzipped and non-gzipped versions. To fix this, the ETag should be calculated based on the original (non-gzipped) file's st_mtime and st_size
 """
 
@@ -33,7 +33,8 @@ import json
 import urllib.parse
 from pathlib import Path
 
-from static import is_valid_etag
+from static import is_valid_etag, EMPTY_BODY
+from headers import header_map
 import fileio
 
 class StaticGzipMiddleware:
@@ -42,60 +43,75 @@ class StaticGzipMiddleware:
         self.staticgz = Path(staticgz_dir) #.resolve()
         self.statics_json_path = Path(statics_json_path) #.resolve()
         self.statics_data = json.loads(fileio.read(str(self.statics_json_path)).decode('utf8'))
+        # statics.json doesn't change while serving so work out each ETag and
+        # the response headers up front rather than on every request
+        self.gzipped = {}
+        for path, file_data in self.statics_data.items():
+            if 'gzipped_size' in file_data:
+                etag = hashlib.blake2b(f"{file_data['mtime']}{file_data['size']}".encode(), digest_size=16).hexdigest()
+                weak_etag = f'W/"{etag}"'.encode()
+                mime_type, _ = mimetypes.guess_type(str(self.staticgz / path))
+                mime_type = mime_type or "application/octet-stream"
+                etag_header = (b"etag", weak_etag)
+                response_headers = (
+                    (b"content-length", str(file_data["gzipped_size"]).encode()),
+                    (b"content-type", mime_type.encode()),
+                    etag_header,
+                    (b"content-encoding", b"gzip"),
+                )
+                self.gzipped[path] = (weak_etag, response_headers, (etag_header,))
 
     async def __call__(self, scope, receive, send):
-        print(f"Path: {scope['path']}, Headers: {dict(scope['headers'])}")
         if scope["type"] != "http" or scope["method"] != 'GET':
             return await self.app(scope, receive, send)
+
+        headers = header_map(scope)
+        accept_encoding = headers.get(b'accept-encoding', b'')
+        if_none_match = headers.get(b'if-none-match', b'')
+        # Nothing to do for clients that can't take gzip
+        if b'gzip' not in accept_encoding:
+            return await self.app(scope, receive, send)
     
-        path = Path(urllib.parse.unquote(scope["path"]).lstrip("/"))
+        path = str(Path(urllib.parse.unquote(scope["path"]).lstrip("/")))
     
-        file_data = self.statics_data.get(str(path))
-        if file_data and 'gzipped_size' in file_data:
-            accept_encoding = dict(scope['headers']).get(b'accept-encoding', b'').decode('utf-8')
-            if 'gzip' in accept_encoding:
-                gz_file_path = self.staticgz / path
-                exists, mtime, size = fileio.stat(str(gz_file_path))
-                if exists:
-                    print(file_data, str(path), repr(accept_encoding), gz_file_path)
-                    if_none_match = dict(scope['headers']).get(b'if-none-match', b'').decode('utf-8')
-                    await self.serve_gzipped_file(gz_file_path, file_data, if_none_match, send)
-                    return
+        gzipped = self.gzipped.get(path)
+        if gzipped is not None:
+            gz_file_path = self.staticgz / path
+            exists, mtime, size = fileio.stat(str(gz_file_path))
+            if exists:
+                await self.serve_gzipped_file(gz_file_path, gzipped, if_none_match, send, scope)
+                return
     
         await self.app(scope, receive, send)
 
-    async def serve_gzipped_file(self, gz_file_path, file_data, if_none_match, send):
-        etag = hashlib.md5(f"{file_data['mtime']}{file_data['size']}".encode()).hexdigest()
-        weak_etag = f'W/"{etag}"'
-        mime_type, _ = mimetypes.guess_type(str(gz_file_path))
-        mime_type = mime_type or "application/octet-stream"
+    async def serve_gzipped_file(self, gz_file_path, gzipped, if_none_match, send, scope=None):
+        weak_etag, response_headers, not_modified_headers = gzipped
     
         # Compare the If-None-Match header with the generated ETag
         if if_none_match and is_valid_etag(weak_etag, if_none_match):
-            print(f"ETag matches: {if_none_match}")
+            print(f"ETag matches: {if_none_match.decode('utf-8')}")
             await send({
                 "type": "http.response.start",
                 "status": 304,
-                "headers": [
-                    (b"etag", weak_etag.encode()),
-                ],
+                "headers": list(not_modified_headers),
             })
-            await send({"type": "http.response.body", "body": b""})
+            await send(EMPTY_BODY)
             return
     
-        response_headers = [
-            (b"content-length", str(file_data["gzipped_size"]).encode()),
-            (b"content-type", mime_type.encode()),
-            (b"etag", weak_etag.encode()),
-            (b"content-encoding", b"gzip"),
-        ]
-    
         await send({
             "type": "http.response.start",
             "status": 200,
-            "headers": response_headers,
+            # A fresh list each time as later middleware may add to it
+            "headers": list(response_headers),
         })
     
+        # Let the server send the file itself when it can. The path comes from
+        # statics.json rather than the request so it needs no traversal check.
+        full_path = fileio.full_path(str(gz_file_path))
+        if full_path and scope and "http.response.pathsend" in scope.get("extensions", {}):
+            await send({"type": "http.response.pathsend", "path": os.path.abspath(full_path)})
+            return
+
         # XXX Should use chunking really.
         # with gz_file_path.open("rb") as file:
         #     while chunk := file.read(8192):
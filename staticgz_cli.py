@@ -6,13 +6,97 @@
 # MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License
 # for more details.
 
-import gzip
 import hashlib
 import json
 import mimetypes
+import mmap
 import os
+import zlib
 from pathlib import Path
 import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+# libdeflate compresses smaller and faster than zlib when it is installed
+try:
+    import libdeflate
+except ImportError:
+    libdeflate = None
+
+# orjson serialises statics.json much faster than json when it is installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+CHUNK_SIZE = 262144
+
+# Formats that are already compressed, deflate won't make them any smaller
+INCOMPRESSIBLE_EXTENSIONS = frozenset([
+    '.png', '.jpg', '.jpeg', '.gif', '.webp', '.avif', '.ico',
+    '.mp3', '.mp4', '.webm', '.ogg',
+    '.woff', '.woff2',
+    '.gz', '.br', '.zip', '.zst', '.bz2', '.xz',
+])
+# Below this the gzip header and trailer alone outweigh anything saved
+MIN_COMPRESS_SIZE = 150
+
+def compress(content, f_out):
+    if libdeflate is not None:
+        # No streaming interface, but the output is smaller than the mapped input
+        f_out.write(libdeflate.gzip_compress(content, 12))
+        return
+    # A piece at a time so the whole output is never held in memory, 31 gives a gzip wrapper
+    compressor = zlib.compressobj(9, zlib.DEFLATED, 31)
+    for start in range(0, len(content), CHUNK_SIZE):
+        f_out.write(compressor.compress(content[start:start + CHUNK_SIZE]))
+    f_out.write(compressor.flush())
+
+def walk_files(root):
+    # Every file below root as its path relative to root and its DirEntry, whose
+    # stat() is cached. Like rglob, symlinks to directories aren't followed.
+    prefix_length = len(os.path.join(root, ''))
+    directories = [root]
+    while directories:
+        with os.scandir(directories.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    if not entry.is_symlink():
+                        directories.append(entry.path)
+                    continue
+                yield entry.path[prefix_length:], entry
+
+def compress_file(item):
+    static_file, gz_file, rel_path = item
+    # Compress and store the file if gzipping reduces size
+    with open(static_file, "rb") as f_in:
+        st = os.fstat(f_in.fileno())
+        size = st.st_size
+        # Nothing compresses smaller than empty, and an empty file can't be mapped
+        if not size:
+            return rel_path, None
+        # Write next to the target and rename it into place so a half written file is never served
+        os.makedirs(os.path.dirname(gz_file), exist_ok=True)
+        tmp_file = gz_file + ".tmp"
+        # Map the file rather than reading it into a copy, the compressor takes any buffer
+        with mmap.mmap(f_in.fileno(), 0, access=mmap.ACCESS_READ) as content, open(tmp_file, "wb") as f_out:
+            compress(content, f_out)
+            gzipped_size = f_out.tell()
+
+    if gzipped_size < size:
+        os.replace(tmp_file, gz_file)
+        return rel_path, {
+            "mtime": int(st.st_mtime),
+            "size": size,
+            "gzipped_size": gzipped_size,
+        }
+    os.unlink(tmp_file)
+    # else:
+    #     return rel_path, {
+    #         "mtime": static_file.stat().st_mtime,
+    #         "size": len(content),
+    #         "gzipped_size": len(content),  # Mark it as not useful for gzipping
+    #     }
+    return rel_path, None
 
 def populate_staticgz(static_dir, staticgz_dir, statics_json_path):
     static_dir = Path(static_dir).resolve()
@@ -25,62 +109,64 @@ def populate_staticgz(static_dir, staticgz_dir, statics_json_path):
         with statics_json_path.open("r") as f:
             statics_data = json.load(f)
 
-    # Remove any files in staticgz not in static
-    for gz_file in staticgz_dir.rglob('*'):
-        corresponding_static_file = static_dir / gz_file.relative_to(staticgz_dir)
-        if not corresponding_static_file.exists():
-            gz_file.unlink()
+    static_root = str(static_dir)
+    staticgz_root = str(staticgz_dir)
+
+    # Remove any files in staticgz not in static, remembering the ones kept so
+    # the loop below doesn't have to stat each .gz again
+    gz_present = set()
+    if os.path.isdir(staticgz_root):
+        for rel_path, entry in walk_files(staticgz_root):
+            if not os.path.exists(os.path.join(static_root, rel_path)):
+                os.unlink(entry.path)
+            else:
+                gz_present.add(rel_path)
 
     # Process all files in static
-    for static_file in static_dir.rglob('*'):
-        if static_file.is_dir():
+    worklist = []
+    seen = set()
+    for rel_path, entry in walk_files(static_root):
+        seen.add(rel_path)
+        gz_file = os.path.join(staticgz_root, rel_path)
+        # One stat per file, reused for every test below
+        st = entry.stat()
+
+        file_data = statics_data.get(rel_path)
+        if file_data is not None:
+            # If mtime is different or gz_file doesn't exist, reprocess
+            gz_exists = rel_path in gz_present
+            if file_data["mtime"] == int(st.st_mtime) and gz_exists:
+                continue
+            del statics_data[rel_path]
+            if gz_exists:
+                os.unlink(gz_file)
+
+        # Don't spend time deflating files it can't help
+        if st.st_size < MIN_COMPRESS_SIZE or os.path.splitext(entry.name)[1].lower() in INCOMPRESSIBLE_EXTENSIONS:
             continue
 
-        rel_path = static_file.relative_to(static_dir)
-        gz_file = staticgz_dir / rel_path
+        worklist.append((entry.path, gz_file, rel_path))
 
-        if str(rel_path) in statics_data:
-            saved_mtime = statics_data[str(rel_path)]["mtime"]
-            current_mtime = int(static_file.stat().st_mtime)
+    # zlib lets go of the GIL while it compresses so threads can work on several files at once
+    with ThreadPoolExecutor(max_workers=os.cpu_count() or 1) as executor:
+        for rel_path, file_data in executor.map(compress_file, worklist):
+            if file_data is not None:
+                statics_data[rel_path] = file_data
 
-            # If mtime is different or gz_file doesn't exist, reprocess
-            if saved_mtime != current_mtime or not gz_file.exists():
-                statics_data.pop(str(rel_path))
-                gz_file.unlink(missing_ok=True)
-            else:
-                continue
+    # Forget files that are no longer in static
+    for rel_path in [rel_path for rel_path in statics_data if rel_path not in seen]:
+        del statics_data[rel_path]
 
-        # Compress and store the file if gzipping reduces size
-        with static_file.open("rb") as f_in:
-            content = f_in.read()
-        gz_content = gzip.compress(content)
-
-        if len(gz_content) < len(content):
-            gz_file.parent.mkdir(parents=True, exist_ok=True)
-            with gz_file.open("wb") as f_out:
-                f_out.write(gz_content)
-
-            statics_data[str(rel_path)] = {
-                "mtime": int(static_file.stat().st_mtime),
-                "size": len(content),
-                "gzipped_size": len(gz_content),
-            }
-        # else:
-        #     statics_data[str(rel_path)] = {
-        #         "mtime": static_file.stat().st_mtime,
-        #         "size": len(content),
-        #         "gzipped_size": len(content),  # Mark it as not useful for gzipping
-        #     }
-    to_delete = []
-    for relpath in statics_data:
-        if not os.path.exists(os.path.join(static_dir, str(relpath))):
-            to_delete.append(relpath)
-    for k in to_delete:
-        del statics_data[k]
-
-    # Save the statics.json
-    with statics_json_path.open("w") as f:
-        json.dump(statics_data, f, indent=4)
+    # Save the statics.json, written next to it and renamed into place so a reader never sees half of it
+    if orjson is not None:
+        # orjson only indents by two spaces
+        data = orjson.dumps(statics_data, option=orjson.OPT_INDENT_2)
+    else:
+        data = json.dumps(statics_data, indent=4).encode('utf8')
+    tmp_file = str(statics_json_path) + ".tmp"
+    with open(tmp_file, "wb") as f:
+        f.write(data)
+    os.replace(tmp_file, statics_json_path)
 
 staticgz_parser = argparse.ArgumentParser(description="Populate staticgz directory and statics.json file.")
 staticgz_parser.add_argument("static_dir", help="Path to the static directory.")
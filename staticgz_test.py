@@ -77,7 +77,7 @@ class TestStaticGzipMiddleware(unittest.IsolatedAsyncioTestCase):
 
     async def test_etag_generation_and_304_response(self):
         # Calculate expected ETag based on mtime and size
-        expected_etag = hashlib.md5(f"{self.file_data['mtime']}{self.file_data['size']}".encode()).hexdigest()
+        expected_etag = hashlib.blake2b(f"{self.file_data['mtime']}{self.file_data['size']}".encode(), digest_size=16).hexdigest()
         expected_weak_etag = f'W/"{expected_etag}"'
 
         # First request to get the file and its ETag
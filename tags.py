@@ -13,6 +13,8 @@ def escape(s, quote=True):
     characters, both double quote (") and single quote (') characters are also
     translated.
     """
+    # Chained replace() beats str.translate() here: the strings are short and
+    # mostly have nothing to escape, and MicroPython has no translate() anyway
     s = s.replace("&", "&amp;") # Must be done first!
     s = s.replace("<", "&lt;")
     s = s.replace(">", "&gt;")
@@ -22,9 +24,28 @@ def escape(s, quote=True):
     return s
 
 
+# Tag, attribute and placeholder names come from a small fixed set so keep
+# their escaped forms. Text and attribute values are too varied to be worth it.
+MAX_ESCAPED_NAMES = 1024
+escaped_names = {}
+
+def escape_name(name):
+    escaped = escaped_names.get(name)
+    if escaped is None:
+        escaped = escape(name)
+        if len(escaped_names) < MAX_ESCAPED_NAMES:
+            escaped_names[name] = escaped
+    return escaped
+
+
 class TemplateTag:
+    __slots__ = ('name', 'attrs', 'children', 'opening', 'closing')
+
     def __init__(self, *k):
         assert len(k)
+        # The rendered <name attrs> and </name>, worked out the first time the tag is built
+        self.opening = None
+        self.closing = None
         if len(k) == 1:
             if type(k[0]) is str:
                 self.name = k[0]
@@ -47,6 +68,8 @@ class TemplateTag:
 tag = TemplateTag
 
 class Placeholder:
+    __slots__ = ('name', 'indent')
+
     def __init__(self, name):
         self.name = name
         self.indent = ''
@@ -55,116 +78,149 @@ def render_attrs(attrs):
     all = []
     for key, value in attrs.items():
         if value is True:
-            all.append(' ' + escape(key))
+            all.append(' ' + escape_name(key))
         elif value is False or value is None:
             pass
         else:
-            all.append(f' {escape(key)}="{escape(value)}"')
+            all.append(f' {escape_name(key)}="{escape(value)}"')
     return ''.join(all)
 
-def tag2template(t, indent='', parts=None, placeholders=None):
-    if parts is None:
-        parts = ['']
-    if placeholders is None:
-        placeholders = []
+def child_tag(item, indent, parts, placeholders, newline):
+    parts[-1].append('\n')
+    build_template(item, indent, parts, placeholders)
+
+def child_str(item, indent, parts, placeholders, newline):
+    parts[-1].append(newline + indent + escape(item))
+
+def child_placeholder(item, indent, parts, placeholders, newline):
+    parts[-1].append('\n')#  + indent
+    placeholders.append((escape_name(item.name), indent, True))
+    parts.append([])
+
+# One dict lookup per child instead of a chain of type() comparisons.
+child_handlers = {
+    TemplateTag: child_tag,
+    str: child_str,
+    Placeholder: child_placeholder,
+}
+
+def build_children(children, indent, parts, placeholders, newline):
+    for item in children:
+        handler = child_handlers.get(type(item))
+        if handler is None:
+            raise ValueError('Unexpected: '+repr(item))
+        handler(item, indent, parts, placeholders, newline)
+
+def build_template(t, indent, parts, placeholders):
+    # Each part is a list of strings joined once at the end, so adding to it
+    # never copies what is already there. Children add to the same lists.
     if t.name is None:
         if type(t.children) is list:
             if len(t.children) == 1 and type(t.children[0]) is str:
-                parts[-1] += escape(t.children[0])
+                parts[-1].append(escape(t.children[0]))
             else:
-                extra_indent = '  '
-                if t.name == 'html':
-                    extra_indent = ''
-                for item in t.children:
-                    if type(item) is TemplateTag:
-                        child_parts, child_placeholders = tag2template(item, indent=indent + extra_indent)
-                        parts[-1] += '\n' + child_parts[0]
-                        parts += child_parts[1:]
-                        placeholders += child_placeholders
-                    elif type(item) is str:
-                        parts[-1] += '\n' + indent + extra_indent + escape(item)
-                    elif type(item) is Placeholder:
-                        parts[-1] += '\n'#  + indent + extra_indent
-                        placeholders.append((escape(item.name), indent + extra_indent, True))
-                        parts.append('')
-                    else:
-                        raise ValueError('Unexpected: '+repr(item))
-
+                build_children(t.children, indent + '  ', parts, placeholders, '\n')
         elif type(t.children) is str:
-            parts[-1] += escape(t.children)
+            parts[-1].append(escape(t.children))
         elif type(t.children) is Placeholder:
-            placeholders.append((escape(t.children.name), indent, False))
+            placeholders.append((escape_name(t.children.name), indent, False))
         else:
             raise ValueError('Unexpected: ' + repr(t.children))
     else:
-        escaped_name = escape(t.name)
-        if t.attrs:
-            parts[-1] += indent+'<' + escaped_name + render_attrs(t.attrs) + '>'
-        else:
-            parts[-1] += indent+'<' + escaped_name + '>'
+        if t.opening is None:
+            escaped_name = escape_name(t.name)
+            if t.attrs:
+                t.opening = '<' + escaped_name + render_attrs(t.attrs) + '>'
+            else:
+                t.opening = '<' + escaped_name + '>'
+            t.closing = '</' + escaped_name + '>'
+        closing = t.closing
+        parts[-1].append(indent + t.opening)
         if t.children is not None:
             if type(t.children) is list:
                 if len(t.children) == 1 and type(t.children[0]) is str:
-                    parts[-1] += escape(t.children[0]) + '</' + escaped_name + '>'
+                    parts[-1].append(escape(t.children[0]) + closing)
                 else:
                     extra_indent = '  '
                     if t.name == 'html':
                         extra_indent = ''
-                    for item in t.children:
-                        if type(item) is TemplateTag:
-                            child_parts, child_placeholders = tag2template(item, indent=indent + extra_indent)
-                            parts[-1] += '\n' + child_parts[0]
-                            parts += child_parts[1:]
-                            placeholders += child_placeholders
-                        elif type(item) is str:
-                            parts[-1] +=  indent + extra_indent + escape(item)
-                        elif type(item) is Placeholder:
-                            parts[-1] += '\n'#  + indent + extra_indent
-                            placeholders.append((escape(item.name), indent + extra_indent, True))
-                            parts.append('')
-                        else:
-                            raise ValueError('Unexpected: '+repr(item))
-                    parts[-1] += '\n' + indent+'</' + escaped_name + '>'
+                    build_children(t.children, indent + extra_indent, parts, placeholders, '')
+                    parts[-1].append('\n' + indent + closing)
             elif type(t.children) is str:
-                parts[-1] += escape(t.children) + '</' + escaped_name + '>'
+                parts[-1].append(escape(t.children) + closing)
             elif type(t.children) is Placeholder:
-                placeholders.append((escape(t.children.name), indent, False))
-                parts.append('</' + escaped_name + '>')
+                placeholders.append((escape_name(t.children.name), indent, False))
+                parts.append([closing])
             else:
                 raise ValueError('Unexpected: ' + repr(t.children))
-    return parts, placeholders
+
+def tag2template(t, indent='', parts=None, placeholders=None):
+    if parts is None:
+        parts = ['']
+    if placeholders is None:
+        placeholders = []
+    slots = [[part] for part in parts]
+    build_template(t, indent, slots, placeholders)
+    return [''.join(slot) for slot in slots], placeholders
 
 def tag2html(t, indent=''):
     parts, placeholders = tag2template(t, indent)
     assert placeholders == []
     return parts[0]
 
-def render_template(template, values=None):
-    if values is None:
-        values = {}
-    result = ''
+def render_value(block, placeholder):
+    if type(block) is TemplateTag:
+        # Indent the whole block
+        return tag2html(block, indent=placeholder[1])
+    elif placeholder[2]:
+        # This is a part of a child list, so indent it
+        return placeholder[1] + block
+    else:
+        # This is a standalone child, don't indent it
+        return block
+
+def partial_template(template, values):
+    # Render only the placeholders named in values, keeping the rest for later
     parts, placeholders = template
-    result += parts[0]
+    new_parts = [parts[0]]
+    new_placeholders = []
     for i, part in enumerate(parts[1:]):
-        block = values[placeholders[i][0]]
-        if type(block) is TemplateTag:
-            # Indent the whole block
-            result += tag2html(block, indent=placeholders[i][1]) + part
-        elif placeholders[i][2]:
-            # This is a part of a child list, so indent it
-            result += placeholders[i][1] + values[placeholders[i][0]] + part
+        if placeholders[i][0] in values:
+            new_parts[-1] += render_value(values[placeholders[i][0]], placeholders[i]) + part
         else:
-            # This is a standalone child, don't indent it
-            result += values[placeholders[i][0]] + part
-    return result
+            new_placeholders.append(placeholders[i])
+            new_parts.append(part)
+    return new_parts, new_placeholders
+
+def compile_template(template):
+    # The parts and placeholders never change once built, so write out a function
+    # that joins them in one straight line instead of looping over them each render
+    parts, placeholders = template
+    items = ['parts[0]']
+    for i in range(len(placeholders)):
+        items.append('render_value(values[%r], placeholders[%d])' % (placeholders[i][0], i))
+        items.append('parts[%d]' % (i + 1))
+    source = (
+        'def render(values, parts=parts, placeholders=placeholders, render_value=render_value):\n'
+        "    return ''.join((" + ', '.join(items) + ',))\n'
+    )
+    namespace = {'parts': parts, 'placeholders': placeholders, 'render_value': render_value}
+    exec(source, namespace)
+    return namespace['render']
 
 class Template:
     def __init__(self, tree):
          self.template = tag2template(tree)
+         self.renderer = compile_template(self.template)
 
     def render(self, **values):
-         return render_template(self.template, values)
+         return self.renderer(values)
 
+    def partial(self, **values):
+         template = Template.__new__(Template)
+         template.template = partial_template(self.template, values)
+         template.renderer = compile_template(template.template)
+         return template
 
 if __name__ == '__main__':
     import time
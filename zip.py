@@ -6,12 +6,15 @@
 # MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License
 # for more details.
 
-import glob
+import fnmatch
 import os
+import re
 import sys
-import time
 import zipfile
 
+# Level 9 takes far longer than 6 for very little smaller output on code and text
+COMPRESS_LEVEL = 6
+
 def load_zipignore_patterns(zipignore_file):
     patterns = []
     if os.path.exists(zipignore_file):
@@ -22,34 +25,37 @@ def load_zipignore_patterns(zipignore_file):
                     patterns.append(line)
     return patterns
 
-def should_ignore(file_path, patterns):
+def compile_zipignore_patterns(patterns):
+    """Combine the .zipignore globs into one regex so each path is checked in a single match."""
+    if not patterns:
+        return None
+    return re.compile('|'.join('(?:' + fnmatch.translate(os.path.normcase(pattern)) + ')' for pattern in patterns))
+
+def should_ignore(file_path, compiled):
     """Check if the file or directory matches any of the .zipignore patterns using glob."""
-    for pattern in patterns:
-        # Convert .zipignore patterns into a glob-friendly pattern
-        if glob.fnmatch.fnmatch(file_path, pattern) or glob.fnmatch.fnmatch(os.path.basename(file_path), pattern):
-            return True
-    return False
+    if compiled is None:
+        return False
+    # Like fnmatch, try both the whole path and just its name
+    file_path = os.path.normcase(file_path)
+    return bool(compiled.match(file_path) or compiled.match(os.path.basename(file_path)))
 
 def zip_dir(zf, dir_to_zip, ignore_patterns=[]):
+    compiled = compile_zipignore_patterns(ignore_patterns)
     for root, dirs, files in os.walk(dir_to_zip):
         # Remove ignored directories based on .zipignore
-        dirs[:] = [d for d in dirs if not should_ignore(os.path.relpath(os.path.join(root, d), dir_to_zip), ignore_patterns)]
+        dirs[:] = [d for d in dirs if not should_ignore(os.path.relpath(os.path.join(root, d), dir_to_zip), compiled)]
         for file in files:
             abs_file = os.path.join(root, file)
             arcname = os.path.relpath(abs_file, dir_to_zip)
             # Skip files that match .zipignore patterns
-            if not should_ignore(abs_file, ignore_patterns):
-                stat = os.stat(abs_file)  # Use abs_file here
-                zip_info = zipfile.ZipInfo(arcname)
-                mod_time = time.localtime(stat.st_mtime)
-                zip_info.date_time = mod_time[:6]  # first six elements: (year, month, day, hour, minute, second)
-                with open(abs_file, 'rb') as file:
-                    if arcname.startswith('wwwgz/'):
-                        print('    STORED', arcname)
-                        zf.writestr(zip_info, file.read(), compress_type=zipfile.ZIP_STORED)
-                    else:
-                        print('COMPRESSED', arcname)
-                        zf.writestr(zip_info, file.read(), compress_type=zipfile.ZIP_DEFLATED, compresslevel=9)
+            if not should_ignore(abs_file, compiled):
+                # write() takes the date and size from the file and streams it into the archive
+                if arcname.startswith('wwwgz/'):
+                    print('    STORED', arcname)
+                    zf.write(abs_file, arcname, compress_type=zipfile.ZIP_STORED)
+                else:
+                    print('COMPRESSED', arcname)
+                    zf.write(abs_file, arcname, compress_type=zipfile.ZIP_DEFLATED, compresslevel=COMPRESS_LEVEL)
 
 if __name__ == '__main__':
     import json
@@ -68,5 +74,5 @@ if __name__ == '__main__':
 
     # Create the zip file
     zip_filename = sys.argv[2]
-    with zipfile.ZipFile(zip_filename, 'w', zipfile.ZIP_DEFLATED, compresslevel=9) as zf:
+    with zipfile.ZipFile(zip_filename, 'w', zipfile.ZIP_DEFLATED, compresslevel=COMPRESS_LEVEL) as zf:
         zip_dir(zf, '.', ignore_patterns=ignore_patterns)